@@ -0,0 +1,103 @@
+# coding: utf-8
+
+"""
+Микробенчмарк разбора дат мероприятий: прежний str_to_datetaime против misc/dates.py.
+
+Разбираются все поля дат событий из bench/fake_api.py теми же наборами форматов,
+что и в events.py.
+
+    python bench/dates.py --activities 20000
+"""
+
+import os
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_api import activity  # noqa: E402
+from misc.dates import DateParser  # noqa: E402
+
+# как в events.py; у двух полей формат передаётся строкой, а не списком
+FIELD_FORMATS = {
+    "created": ["%Y-%m-%d %H:%M:%S"],
+    "date_start": ["%Y-%m-%d"],
+    "time_start": ["%H:%M:%S"],
+    "date_end": ["%Y-%m-%d"],
+    "time_end": ["%H:%M:%S"],
+    "local_datetime": ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d"],
+    "local_datetime_end": "%Y-%m-%d %H:%M:%S",
+    "date_sorter": "%Y-%m-%d %H:%M:%S",
+}
+
+
+def legacy_str_to_datetaime(s: str, formats: list):
+    """
+    str_to_datetaime до перехода на misc/dates.py.
+    """
+    if not s:
+        return None
+
+    dt = None
+    for format in formats:
+        try:
+            dt = datetime.strptime(s, format)
+        except Exception:
+            pass
+
+        if dt:
+            break
+
+    return dt
+
+
+def run(parse, events: list, field_formats: dict) -> float:
+    start = perf_counter()
+    for event in events:
+        for field, formats in field_formats.items():
+            parse(event.get(field), formats)
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description="Замер разбора дат мероприятий.")
+    parser.add_argument("--activities", type=int, default=20000)
+    parser.add_argument("--universities", type=int, default=10)
+    args = parser.parse_args()
+
+    per_university = max(1, args.activities // args.universities)
+    events = [
+        activity(university_id, i)
+        for university_id in range(1, args.universities + 1)
+        for i in range(per_university)
+    ]
+    # прежняя функция со строкой вместо списка перебирает её символы, так что честнее
+    # сравнивать и с исправленными списками форматов
+    listed = {field: [formats] if isinstance(formats, str) else formats for field, formats in FIELD_FORMATS.items()}
+
+    uncached = DateParser(cache_size=0)
+    cached = DateParser()
+    results = [
+        ("legacy, as called", run(legacy_str_to_datetaime, events, FIELD_FORMATS)),
+        ("legacy, format lists", run(legacy_str_to_datetaime, events, listed)),
+        ("fast paths, no cache", run(lambda s, f: uncached.parse(s, tuple(f)) if s else None, events, listed)),
+        ("fast paths + LRU", run(lambda s, f: cached.parse(s, tuple(f)) if s else None, events, listed)),
+    ]
+
+    values = len(events) * len(FIELD_FORMATS)
+    baseline = results[1][1]
+    print(f"{len(events)} activities, {values} values")
+    for name, seconds in results:
+        print(
+            f"{name:<22} {seconds:>8.3f} s {values / seconds:>12.0f} values/s "
+            f"{baseline / seconds:>6.1f}x"
+        )
+    info = cached.parse.cache_info()
+    print(f"LRU: {info.hits} hits, {info.misses} misses, {info.currsize}/{info.maxsize} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# coding: utf-8
+
+"""
+Локальная замена API Facultetus для замеров.
+
+Отдаёт getPositions, getActivities, getUniversities и getlib с настраиваемым
+размером страницы, задержкой, долей ошибок 503, лимитом запросов в секунду
+(сверх него — 429 с Retry-After) и числом записей.
+Данные детерминированы: одна и та же запись всегда выглядит одинаково.
+getActivities, как и настоящий API, отдаёт мероприятия от новых к старым:
+с ростом activities новые появляются на первой странице.
+
+Запуск отдельно: python bench/fake_api.py --port 8800 --latency 0.05
+"""
+
+import json
+import random
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlparse
+
+SPHERES = ["IT", "Продажи", "Маркетинг", "Финансы", "Производство", "Образование", "HR", "Логистика"]
+ACTIVITY_TYPES = ["fair", "webinar", "lecture", "contest", "excursion"]
+CREATED_FROM = datetime(2024, 1, 1, 10, 0)
+
+
+class FakeConfig:
+    def __init__(
+        self,
+        positions: int = 2000,
+        universities: int = 20,
+        activities: int = 100,
+        page_size: int = 20,
+        university_page_size: int = 50,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        newest_first: bool = True
+    ):
+        self.positions = positions
+        self.universities = universities
+        self.activities = activities
+        self.page_size = page_size
+        self.university_page_size = university_page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        # порядок мероприятий; oldest first — для проверки выгрузки без ранней остановки
+        self.newest_first = newest_first
+
+
+def position(i: int) -> dict:
+    rnd = random.Random(i)
+    employer_id = rnd.randint(1, max(1, i // 5 + 1))
+    return {
+        "position_id": i + 1,
+        "employer_id": employer_id,
+        "employer_title": f"Организация {employer_id}",
+        "employer_slogan": None,
+        "employer_logo": f"/logo/{employer_id}.png",
+        "employer_type": "Коммерческая",
+        "title": f"Вакансия {i + 1}",
+        "type": rnd.choice(["job", "internship", "practice"]),
+        "lookingfor": None,
+        "region": "Новосибирская область",
+        "city": "Новосибирск",
+        "address": f"ул. Тестовая, {rnd.randint(1, 200)}",
+        "background_pic": None,
+        "description": "Описание вакансии. " * rnd.randint(1, 20),
+        "requirements": "Требования. " * rnd.randint(0, 10),
+        "cond": "Условия. " * rnd.randint(0, 10),
+        "edu_trial_accept": str(rnd.randint(0, 1)),
+        "tempjob": str(rnd.randint(0, 1)),
+        "forinternationals": "0",
+        "fornewbies": str(rnd.randint(0, 1)),
+        "fordisabled": "0",
+        "remoted": str(rnd.randint(0, 1)),
+        "edu_combo_friendly": "1",
+        "first_year_friendly": "0",
+        "for_graduates": "1",
+        "instant_paid": "1",
+        "cash_from": str(rnd.choice([0, 20000, 30000, 50000])),
+        "cash_to": str(rnd.choice([0, 60000, 90000])),
+        "is_actual": "1",
+        "position_link": f"https://facultetus.ru/position/{i + 1}",
+        "spheres": [{"data": sphere} for sphere in rnd.sample(SPHERES, rnd.randint(1, 3))],
+        "langs": [{"data": "Английский"}] if rnd.random() < 0.3 else [],
+        "skills": [{"data": f"Навык {rnd.randint(1, 50)}"} for _ in range(rnd.randint(0, 4))],
+        "tests": [],
+        "professions": [{"data": "Специалист"}],
+    }
+
+
+def activity(university_id: int, i: int) -> dict:
+    rnd = random.Random(university_id * 100003 + i)
+    day = 1 + i % 28
+    return {
+        "id": str(university_id * 100000 + i),
+        # мероприятие с большим номером создано позже
+        "created": (CREATED_FROM + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+        "cprofile_id": str(rnd.randint(1, 1000)),
+        "type": rnd.choice(ACTIVITY_TYPES),
+        "type_text": "Мероприятие",
+        "published": "1",
+        "university_id": str(university_id),
+        "title": f"Мероприятие {i}",
+        "description": "Описание мероприятия. " * rnd.randint(1, 30),
+        "date_start": f"2024-02-{day:02d}",
+        "time_start": "10:00:00",
+        "date_end": f"2024-02-{day:02d}",
+        "time_end": "12:00:00",
+        "region": "Новосибирская область",
+        "city": "Новосибирск",
+        "online": str(rnd.randint(0, 1)),
+        "local_datetime": f"2024-02-{day:02d} 10:00:00",
+        "local_datetime_end": f"2024-02-{day:02d} 12:00:00",
+        "date_sorter": f"2024-02-{day:02d} 10:00:00",
+        "photo_payload": None,
+    }
+
+
+def university(i: int) -> dict:
+    return {
+        "university_id": i + 1,
+        "title": f"ВУЗ {i + 1}",
+        "title_full": f"Университет номер {i + 1}",
+        "region": "Новосибирская область",
+        "city": "Новосибирск",
+        "type": "1",
+        "instant_subscription": "1",
+        "instant_student_access": "0",
+    }
+
+
+def make_handler(config: FakeConfig):
+    # запросы текущей секунды для лимита rate_limit
+    window = {"second": 0, "requests": 0}
+    window_lock = Lock()
+
+    def over_limit() -> bool:
+        with window_lock:
+            second = int(monotonic())
+            if window["second"] != second:
+                window.update(second=second, requests=0)
+            window["requests"] += 1
+            return window["requests"] > config.rate_limit
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+            if config.rate_limit and over_limit():
+                return self.reply(429, {"error": "Too Many Requests"}, {"Retry-After": "1"})
+
+            if config.latency:
+                sleep(config.latency)
+            if config.error_rate and random.random() < config.error_rate:
+                return self.reply(503, {"error": "Service Unavailable"})
+
+            offset = int(query.get("offset", 0))
+            if endpoint == "getlib":
+                body = {"spheres": SPHERES}
+            elif endpoint == "getPositions":
+                end = min(offset + config.page_size, config.positions)
+                body = {"response": [position(i) for i in range(offset, end)]}
+            elif endpoint == "getActivities":
+                university_id = int(query.get("university_id", 0))
+                end = min(offset + int(query.get("limit", config.page_size)), config.activities)
+                numbers = range(offset, end)
+                if config.newest_first:
+                    numbers = [config.activities - 1 - i for i in numbers]
+                body = {"response": [activity(university_id, i) for i in numbers]}
+            elif endpoint == "getUniversities":
+                # как и настоящий API, limit игнорируется
+                end = min(offset + config.university_page_size, config.universities)
+                body = {"response": [university(i) for i in range(offset, end)]}
+            else:
+                return self.reply(404, {"error": "Not Found"})
+            self.reply(200, body)
+
+        def reply(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # клиент отменил упреждающий запрос
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start(config: FakeConfig, port: int = 0) -> ThreadingHTTPServer:
+    """
+    Запустить сервер в фоновом потоке. Адрес API: http://127.0.0.1:<server.server_port>/api
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config))
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Локальная замена API Facultetus.")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--positions", type=int, default=2000)
+    parser.add_argument("--universities", type=int, default=20)
+    parser.add_argument("--activities", type=int, default=100, help="мероприятий на ВУЗ")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="запросов в секунду до ответов 429")
+    parser.add_argument("--oldest-first", action="store_true", help="отдавать мероприятия от старых к новым")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port),
+        make_handler(FakeConfig(
+            positions=args.positions,
+            universities=args.universities,
+            activities=args.activities,
+            page_size=args.page_size,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            rate_limit=args.rate_limit,
+            newest_first=not args.oldest_first,
+        ))
+    )
+    print(f"Fake API: http://127.0.0.1:{args.port}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
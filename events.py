@@ -4,99 +4,368 @@
 Все мероприятия из выбранныз ВУЗов.
 """
 
-from requests import get
+from argparse import ArgumentParser
+from collections import defaultdict
+from datetime import datetime
+from functools import partial
+from sqlalchemy import insert, select
 from time import time
 
 from configs.facultetus import api_config
+from misc.bulk import prepare_rows, upsert_rows, write_isolated
+from misc.checkpoint import Checkpoints
+from misc.client import client
+from misc.dead_letter import DeadLetters
+from misc.fanout import FanOut
 from misc.helpers import exit_on_fail, session, str_to_datetaime
+from misc.key_index import KeyIndex
 from misc.log import logger
-from misc.tables import FacultetusActivity, FacultetusActivityType, FacultetusUniversity
+from misc.metrics import run_metrics
+from misc.paginator import Paginator, pagination_stats
+from misc.pipeline import Pipeline
+from misc.profiling import add_argument as add_profile_argument, profiled
+from misc.tables import FacultetusActivity, FacultetusActivitySync, FacultetusActivityType, \
+    FacultetusUniversity
 
-university_ids_raw = session.query(FacultetusUniversity.university_id).all()
-university_ids = [elem for tup in university_ids_raw for elem in tup]
 
+def parse_created(event: dict):
+    return str_to_datetaime(event.get("created"), ["%Y-%m-%d %H:%M:%S"])
+
+
+def newest_first(created: list, previous=None) -> bool:
+    """
+    Даты создания created идут от новых к старым и не новее previous — последней даты
+    предыдущей страницы. Ранняя остановка инкрементальной выгрузки опирается на этот
+    порядок getActivities: если он нарушен, ВУЗ выгружается целиком.
+    """
+    for dt in created:
+        if dt is None or (previous is not None and dt > previous):
+            return False
+        previous = dt
+    return True
+
+
+def is_known_page(events: list, created: list, watermark, activity_ids: KeyIndex) -> bool:
+    """
+    Все события страницы уже загружены и созданы (даты created) не позже отметки watermark.
+    """
+    return all(
+        event["id"] in activity_ids and dt is not None and dt <= watermark
+        for event, dt in zip(events, created)
+    )
+
+
+def activity_paginator(university_id) -> Paginator:
+    """
+    Страницы getActivities ВУЗа по LIMIT событий. В режиме STREAM_PAGES ответ разбирается
+    потоково и отдаётся пачками по STREAM_BATCH записей, не дожидаясь конца страницы.
+    """
+    return Paginator(
+        "getActivities",
+        {"university_id": university_id},
+        page_size=api_config["LIMIT"],
+        send_limit=True,
+        stream_batch=api_config.get("STREAM_BATCH", 100) if api_config.get("STREAM_PAGES") else None,
+    )
+
+
+def fetch_university_events(
+    university_id,
+    fan_out: FanOut,
+    watermark=None,
+    activity_ids: KeyIndex = None,
+    start_offset: int = 0
+) -> dict:
+    """
+    Выгрузить страницы getActivities одного ВУЗа начиная со смещения start_offset в fan_out.
+    Последний кусок каждой страницы несёт смещение следующей — для отметки продолжения.
+
+    Если задана отметка watermark, выгрузка останавливается на первой странице,
+    где все события уже известны и не новее отметки, — при условии, что API отдаёт
+    события от новых к старым (см. newest_first). Иначе страницы уже известных
+    событий пропускаются, но выгрузка идёт до конца. Возвращает статистику по ВУЗу
+    и новую отметку — максимальную дату создания среди выгруженных событий.
+    """
+    stats = {"university_id": university_id, "pages": 0, "events": 0, "watermark": watermark}
+    start = time()
+    known = True
+    # порядок проверяется по всем событиям ВУЗа подряд, через границы страниц
+    ordered, previous, dated = True, None, 0
+    for page in activity_paginator(university_id).pages(start_offset):
+        if fan_out.stopped:
+            break
+        stats["events"] += len(page.records)
+        created = [parse_created(event) for event in page.records]
+        if watermark and ordered:
+            ordered = newest_first(created, previous)
+            if not ordered:
+                logger.getLogger("events.py").warning(
+                    f"University {university_id}: getActivities is not sorted newest first, read all pages"
+                )
+            elif created:
+                previous, dated = created[-1], dated + len(created)
+
+        if not (watermark and is_known_page(page.records, created, watermark, activity_ids)):
+            known = False
+
+            created = [dt for dt in created if dt]
+            if created and (not stats["watermark"] or max(created) > stats["watermark"]):
+                stats["watermark"] = max(created)
+
+            if not fan_out.put((university_id, page.number, page.records, page.end if page.last else None)):
+                break
+
+        if page.last:
+            stats["pages"] += 1
+            # следующая страница не запрашивается: дальше только уже загруженные события;
+            # по одному событию порядок не проверить
+            if watermark and known and ordered and dated > 1:
+                break
+            known = True
+
+    stats["fetch_time"] = time() - start
+    return stats
+
+
+def parse_event_dates(event: dict):
+    """
+    Разобрать поля дат события построчно.
+    """
+    event["created"] = parse_created(event)
+    event["date_start"] = str_to_datetaime(
+        event.get("date_start"), ["%Y-%m-%d"]
+    )
+    event["time_start"] = str_to_datetaime(
+        event.get("time_start"), ["%H:%M:%S"]
+    )
+    event["date_end"] = str_to_datetaime(
+        event.get("date_end"), ["%Y-%m-%d"]
+    )
+    event["time_end"] = str_to_datetaime(
+        event.get("time_end"), ["%H:%M:%S"]
+    )
+    event["local_datetime"] = str_to_datetaime(
+        event.get("local_datetime"), ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+    )
+    event["local_datetime_end"] = str_to_datetaime(
+        event.get("local_datetime_end"), "%Y-%m-%d %H:%M:%S"
+    )
+    event["date_sorter"] = str_to_datetaime(
+        event.get("date_sorter"), "%Y-%m-%d %H:%M:%S"
+    )
+
+
+def join_photo_payload(event: dict):
+    event["photo_payload"] = ",".join(event.get("photo_payload") or []) \
+        if not event.get("photo_payload") else None
+
+
+def prepare_event(event: dict):
+    """
+    Разобрать поля одного события.
+    """
+    parse_event_dates(event)
+    join_photo_payload(event)
+
+
+def prepare_events(page: tuple, activity_ids: KeyIndex) -> tuple:
+    """
+    Оставить на странице (ВУЗ, номер, события, смещение следующей) только новые события
+    и разобрать их поля. Возвращает (ВУЗ, номер, события, отбракованные события с ошибками,
+    смещение следующей).
+    """
+    university_id, page_number, events, end = page
+    events = [event for event in events if event["id"] not in activity_ids]
+    run_metrics.add("rows_transformed", len(events))
+    prepared, rejected = [], []
+    for event in events:
+        try:
+            prepare_event(event)
+            prepared.append(event)
+        except Exception as e:
+            rejected.append((event, e))
+    return university_id, page_number, prepared, rejected, end
+
+
+def insert_events(events: list):
+    _, rows = prepare_rows(FacultetusActivity, events)
+    session.execute(insert(FacultetusActivity.__table__), rows)
+
+
+def write_events(events: list, types_dict: dict, activity_ids: KeyIndex, dead_letters: DeadLetters) -> int:
+    """
+    Записать подготовленные события одной страницы одним пакетным INSERT.
+
+    События, которые БД не принимает, уходят в dead_letters, остальные записываются.
+    Возвращает число добавленных.
+    """
+    # событие могло прийти на соседней странице, пока эта ждала записи
+    events = list({event["id"]: event for event in events if event["id"] not in activity_ids}.values())
+    for event in events:
+        if event["type"] not in types_dict:
+            activity_type = FacultetusActivityType(name=event["type"])
+            session.add(activity_type)
+            # id нового типа нужен до пакетной вставки событий
+            session.flush()
+            types_dict[event["type"]] = activity_type.id
+        event["type_id"] = types_dict.get(event["type"])
+
+    rejected = set()
+
+    def reject(event: dict, error: Exception):
+        rejected.add(event["id"])
+        dead_letters.add(event, error)
+
+    write_isolated(session, insert_events, events, reject)
+    added = [event["id"] for event in events if event["id"] not in rejected]
+    activity_ids.update(added)
+    session.commit()
+    return len(added)
+
+
+def iter_event_pages(
+    university_ids: list,
+    watermarks: dict,
+    activity_ids: KeyIndex,
+    summary: list,
+    checkpoints: Checkpoints
+):
+    """
+    Страницы getActivities всех ВУЗов в виде (ВУЗ, номер страницы, события, смещение следующей)
+    по мере готовности; каждый ВУЗ начинается с отметки checkpoints.
+
+    ВУЗы выгружаются параллельно в api_config["WORKERS"] потоков (misc/fanout.py).
+    После последней страницы в summary добавляется статистика по каждому ВУЗу.
+    """
+    def fetch(university_id, fan_out: FanOut) -> dict:
+        return fetch_university_events(
+            university_id, fan_out, watermarks.get(university_id), activity_ids,
+            checkpoints.start(university_id)
+        )
+
+    fan_out = FanOut(api_config.get("WORKERS", 1))
+    yield from fan_out.run(fetch, university_ids)
+    summary.extend(fan_out.results)
+
+
+def print_summary(summary: list):
+    """
+    Время выгрузки по каждому ВУЗу, самые долгие сверху.
+    """
+    print("University timings:")
+    for stats in sorted(summary, key=lambda stats: stats["fetch_time"], reverse=True):
+        line = (
+            f"{stats['university_id']}: {stats['fetch_time']:.2f} sec, "
+            f"{stats['pages']} pages, {stats['events']} events, {stats['added']} added"
+        )
+        logger.getLogger("events.py").info(line)
+        print(f">> {line}")
+
+
+def sync_events(full: bool = False, university_ids: list = None, resume: bool = False) -> list:
+    """
+    Выгрузить мероприятия ВУЗов university_ids (по умолчанию — всех из facultetus_university).
+
+    По умолчанию выгрузка инкрементальная: для каждого ВУЗа страницы
+    запрашиваются до отметки из facultetus_activity_sync. При full=True
+    история всех ВУЗов перечитывается целиком. При resume=True каждый ВУЗ
+    продолжается со страницы, на которой прервался прошлый запуск.
+    Возвращает сводку по ВУЗам.
+    """
+    if university_ids is None:
+        university_ids_raw = session.query(FacultetusUniversity.university_id).all()
+        university_ids = [elem for tup in university_ids_raw for elem in tup]
 
-@exit_on_fail("events.py")
-def main():
     types_list = [type.__dict__ for type in session.query(FacultetusActivityType).all()]
     types_dict = {sphere['name']: sphere['id'] for sphere in types_list}
     print(types_dict)
+    activity_ids = KeyIndex.load(session, FacultetusActivity.id)
+    watermarks = {} if full else dict(
+        session.execute(
+            select(FacultetusActivitySync.university_id, FacultetusActivitySync.watermark)
+        ).all()
+    )
 
-    for university_id in university_ids:
-        print(f"> University ID: {university_id}...")
-        current_offset = 0
-        while True:
-            response = get(
-                url=f"https://facultetus.ru/api/{api_config['CLIENT_ID']}/getActivities",
-                headers={
-                    "Content-Type": "application/json; charset=UTF-8",
-                },
-                params={
-                    "university_id": university_id,
-                    "offset": current_offset,
-                    "limit": api_config["LIMIT"],
-                },
-            )
-
-            if not response.json().get("response"):
-                print("No data found")
-                break
-            else:
-                print(f">> Page {int(current_offset / api_config['OFFSET'])}...")
-
-            for event in response.json()["response"]:
-                if (
-                    not session.query(FacultetusActivity)
-                    .filter(FacultetusActivity.id == event["id"])
-                    .one_or_none()
-                ):
-                    event["created"] = str_to_datetaime(
-                        event.get("created"), ["%Y-%m-%d %H:%M:%S"]
-                    )
-                    event["date_start"] = str_to_datetaime(
-                        event.get("date_start"), ["%Y-%m-%d"]
-                    )
-                    event["time_start"] = str_to_datetaime(
-                        event.get("time_start"), ["%H:%M:%S"]
-                    )
-                    event["date_end"] = str_to_datetaime(
-                        event.get("date_end"), ["%Y-%m-%d"]
-                    )
-                    event["time_end"] = str_to_datetaime(
-                        event.get("time_end"), ["%H:%M:%S"]
-                    )
-                    event["local_datetime"] = str_to_datetaime(
-                        event.get("local_datetime"), ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
-                    )
-                    event["local_datetime_end"] = str_to_datetaime(
-                        event.get("local_datetime_end"), "%Y-%m-%d %H:%M:%S"
-                    )
-                    event["photo_payload"] = ",".join(event.get("photo_payload") or []) \
-                        if not event.get("photo_payload") else None
-                    event["date_sorter"] = str_to_datetaime(
-                        event.get("date_sorter"), "%Y-%m-%d %H:%M:%S"
-                    )
-
-                    if (
-                        not session.query(FacultetusActivityType)
-                        .filter(FacultetusActivityType.name == event["type"])
-                        .one_or_none()
-                    ):
-                        types_dict[event["type"]] = max(types_dict.values()) + 1
-                        session.add(FacultetusActivityType(name=event["type"]))
-
-                    event["type_id"] = types_dict.get(event["type"])
-
-                    session.add(FacultetusActivity(**event))
-            session.commit()
-
-            current_offset += api_config["OFFSET"]
+    checkpoints = Checkpoints(session, "getActivities", resume)
+    dead_letters = DeadLetters(session, "getActivities", "id")
+    # отбракованные события считаются известными: иначе инкрементальная выгрузка
+    # запрашивала бы их страницы снова при каждом запуске; полная сверка их перечитывает
+    if not full:
+        activity_ids.update(key for key in dead_letters.keys if key.isdigit())
+
+    # страницы запрашиваются и разбираются, пока предыдущие пишутся; в БД пишет только главный поток
+    summary = []
+    added = defaultdict(int)
+    pipeline = Pipeline("events")
+    pages = pipeline.run(
+        iter_event_pages(university_ids, watermarks, activity_ids, summary, checkpoints),
+        partial(prepare_events, activity_ids=activity_ids)
+    )
+    for university_id, page, events, rejected, end in pages:
+        print(f"> University ID: {university_id}, page {page}...")
+        # отметка и отбракованные события коммитятся вместе с событиями страницы в write_events
+        if end is not None:
+            checkpoints.save(university_id, end)
+        for event, error in rejected:
+            dead_letters.add(event, error, "normalize")
+        added[university_id] += write_events(events, types_dict, activity_ids, dead_letters)
+    pipeline.log_summary("events.py")
+    dead_letters.log_summary("events.py")
+
+    upsert_rows(
+        session,
+        FacultetusActivitySync,
+        [
+            {
+                "university_id": stats["university_id"],
+                "watermark": stats["watermark"],
+                "date_updated": datetime.now(),
+            }
+            for stats in summary if stats["watermark"]
+        ],
+        "university_id"
+    )
+    checkpoints.clear()
+    session.commit()
+
+    for stats in summary:
+        stats["added"] = added[stats["university_id"]]
+    print_summary(summary)
+    return summary
+
+
+@exit_on_fail("events.py")
+def main(full: bool = False, resume: bool = False):
+    """
+    Главная функция.
+    """
+    return sync_events(full, resume=resume)
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Мероприятия ВУЗов из getActivities.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="перечитать историю всех ВУЗов целиком, без учёта отметок",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить каждый ВУЗ со страницы, на которой прервался прошлый запуск",
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     start = time()
-    main()
+    try:
+        with profiled(args.profile, "events"), run_metrics.stage("events"):
+            main(full=args.full, resume=args.resume)
+    finally:
+        run_metrics.finish(session, "events.py")
     end = time()
     time_spent = f"Total time spent: {end - start} sec"
     logger.getLogger("events.py").info(time_spent)
     print(f">>> {time_spent} sec")
+    client.log_summary("events.py")
+    pagination_stats.log_summary("events.py")
@@ -7,8 +7,13 @@ import sys
 import logging
 from datetime import datetime
 from functools import wraps
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Event
 from time import time
-from requests import get
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, Column, ForeignKey, Integer, TIMESTAMP, VARCHAR, text, DateTime
 from sqlalchemy.orm import relationship, sessionmaker
@@ -21,6 +26,7 @@ load_dotenv()
 CLIENT_ID = os.getenv("CLIENT_ID")
 LIMIT = int(os.getenv("FACULTETUS_LIMIT", 80))
 OFFSET = int(os.getenv("FACULTETUS_OFFSET", 20))
+WORKERS = int(os.getenv("FACULTETUS_WORKERS", 1))
 
 DB_URL = "{DB_TYPE}+{DB_DRIVER}://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}".format(
     DB_TYPE=os.getenv("DB_TYPE"),
@@ -173,6 +179,85 @@ def str_to_datetaime(s: str, formats):
     return dt
 
 # --- Main Logic ---
+def fetch_university_events(http, university_id, pages, stop):
+    """Fetch all getActivities pages of one university into the pages queue."""
+    stats = {"university_id": university_id, "pages": 0, "events": 0}
+    start = time()
+    current_offset = 0
+    while not stop.is_set():
+        response = http.get(
+            url=f"https://facultetus.ru/api/{CLIENT_ID}/getActivities",
+            headers={"Content-Type": "application/json; charset=UTF-8"},
+            params={
+                "university_id": university_id,
+                "offset": current_offset,
+                "limit": LIMIT,
+            },
+        )
+
+        events = response.json().get("response")
+        if not events:
+            break
+
+        page = (university_id, int(current_offset / OFFSET), events)
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                break
+            except Full:
+                continue
+        stats["pages"] += 1
+        stats["events"] += len(events)
+        current_offset += OFFSET
+
+    stats["fetch_time"] = time() - start
+    return stats
+
+def write_events(events, types_dict):
+    """Insert new events of one page, returns the number added."""
+    added = 0
+    for event in events:
+        if (
+            not session.query(FacultetusActivity)
+            .filter(FacultetusActivity.id == event["id"])
+            .one_or_none()
+        ):
+            event["created"] = str_to_datetaime(event.get("created"), ["%Y-%m-%d %H:%M:%S"])
+            event["date_start"] = str_to_datetaime(event.get("date_start"), ["%Y-%m-%d"])
+            event["time_start"] = str_to_datetaime(event.get("time_start"), ["%H:%M:%S"])
+            event["date_end"] = str_to_datetaime(event.get("date_end"), ["%Y-%m-%d"])
+            event["time_end"] = str_to_datetaime(event.get("time_end"), ["%H:%M:%S"])
+            event["local_datetime"] = str_to_datetaime(
+                event.get("local_datetime"), ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
+            )
+            event["local_datetime_end"] = str_to_datetaime(
+                event.get("local_datetime_end"), "%Y-%m-%d %H:%M:%S"
+            )
+            event["photo_payload"] = ",".join(event.get("photo_payload") or []) \
+                if event.get("photo_payload") else None
+            event["date_sorter"] = str_to_datetaime(
+                event.get("date_sorter"), "%Y-%m-%d %H:%M:%S"
+            )
+
+            if (
+                not session.query(FacultetusActivityType)
+                .filter(FacultetusActivityType.name == event["type"])
+                .one_or_none()
+            ):
+                new_id = (max(types_dict.values()) + 1) if types_dict else 1
+                types_dict[event["type"]] = new_id
+                session.add(FacultetusActivityType(name=event["type"]))
+                session.flush()
+
+            event["type_id"] = types_dict.get(event["type"])
+
+            allowed_keys = FacultetusActivity.__table__.columns.keys()
+            event_data = {k: v for k, v in event.items() if k in allowed_keys}
+            session.add(FacultetusActivity(**event_data))
+            added += 1
+    session.commit()
+    return added
+
 @exit_on_fail("events_single.py")
 def main():
     university_ids_raw = session.query(FacultetusUniversity.university_id).all()
@@ -182,67 +267,42 @@ def main():
     types_dict = {sphere['name']: sphere['id'] for sphere in types_list}
     logger.info(f"Existing activity types: {types_dict}")
 
-    for university_id in university_ids:
-        logger.info(f"> University ID: {university_id}...")
-        current_offset = 0
-        while True:
-            response = get(
-                url=f"https://facultetus.ru/api/{CLIENT_ID}/getActivities",
-                headers={"Content-Type": "application/json; charset=UTF-8"},
-                params={
-                    "university_id": university_id,
-                    "offset": current_offset,
-                    "limit": LIMIT,
-                },
-            )
+    # Universities are fetched concurrently, only the main thread writes to the DB
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
 
-            resp_json = response.json()
-            if not resp_json.get("response"):
-                logger.info("No data found")
-                break
-            else:
-                logger.info(f">> Page {int(current_offset / OFFSET)}...")
-
-            for event in resp_json["response"]:
-                if (
-                    not session.query(FacultetusActivity)
-                    .filter(FacultetusActivity.id == event["id"])
-                    .one_or_none()
-                ):
-                    event["created"] = str_to_datetaime(event.get("created"), ["%Y-%m-%d %H:%M:%S"])
-                    event["date_start"] = str_to_datetaime(event.get("date_start"), ["%Y-%m-%d"])
-                    event["time_start"] = str_to_datetaime(event.get("time_start"), ["%H:%M:%S"])
-                    event["date_end"] = str_to_datetaime(event.get("date_end"), ["%Y-%m-%d"])
-                    event["time_end"] = str_to_datetaime(event.get("time_end"), ["%H:%M:%S"])
-                    event["local_datetime"] = str_to_datetaime(
-                        event.get("local_datetime"), ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]
-                    )
-                    event["local_datetime_end"] = str_to_datetaime(
-                        event.get("local_datetime_end"), "%Y-%m-%d %H:%M:%S"
-                    )
-                    event["photo_payload"] = ",".join(event.get("photo_payload") or []) \
-                        if event.get("photo_payload") else None
-                    event["date_sorter"] = str_to_datetaime(
-                        event.get("date_sorter"), "%Y-%m-%d %H:%M:%S"
-                    )
-
-                    if (
-                        not session.query(FacultetusActivityType)
-                        .filter(FacultetusActivityType.name == event["type"])
-                        .one_or_none()
-                    ):
-                        new_id = (max(types_dict.values()) + 1) if types_dict else 1
-                        types_dict[event["type"]] = new_id
-                        session.add(FacultetusActivityType(name=event["type"]))
-                        session.flush()
-
-                    event["type_id"] = types_dict.get(event["type"])
-
-                    allowed_keys = FacultetusActivity.__table__.columns.keys()
-                    event_data = {k: v for k, v in event.items() if k in allowed_keys}
-                    session.add(FacultetusActivity(**event_data))
-            session.commit()
-            current_offset += OFFSET
+    pages = Queue(maxsize=WORKERS * 2)
+    stop = Event()
+    added = defaultdict(int)
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        futures = [
+            executor.submit(fetch_university_events, http, university_id, pages, stop)
+            for university_id in university_ids
+        ]
+        try:
+            # check the workers first: once they are done the queue can no longer grow
+            while not (all(future.done() for future in futures) and pages.empty()):
+                try:
+                    university_id, page, events = pages.get(timeout=0.1)
+                except Empty:
+                    continue
+                logger.info(f"> University ID: {university_id}, page {page}...")
+                added[university_id] += write_events(events, types_dict)
+
+            summary = [future.result() for future in futures]
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+    logger.info("University timings:")
+    for stats in sorted(summary, key=lambda stats: stats["fetch_time"], reverse=True):
+        logger.info(
+            f">> {stats['university_id']}: {stats['fetch_time']:.2f} sec, {stats['pages']} pages, "
+            f"{stats['events']} events, {added[stats['university_id']]} added"
+        )
 
 if __name__ == "__main__":
     start_time = time()
@@ -0,0 +1,77 @@
+# coding: utf-8
+
+"""
+Архив сырых страниц API и их воспроизведение без обращения к сети.
+
+Каждый запуск пишет свой каталог <ARCHIVE_DIR>/<run>/, в нём по файлу
+<endpoint>.jsonl.gz на endpoint. Файлы только дополняются: одна строка —
+одна страница с параметрами запроса и телом ответа как есть.
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime
+from threading import Lock
+
+
+def params_key(params: dict) -> str:
+    """
+    Каноничный вид параметров запроса: 1 и "1" дают один и тот же ключ.
+    """
+    return json.dumps({key: str(value) for key, value in (params or {}).items()}, sort_keys=True)
+
+
+class PageArchive:
+    """
+    Запись страниц одного запуска в сжатый архив.
+    """
+
+    def __init__(self, directory: str, run: str = None):
+        self.run = run or datetime.now().strftime("%Y%m%d_%H%M%S_") + str(os.getpid())
+        self.path = os.path.join(directory, self.run)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = Lock()
+
+    def write(self, endpoint: str, params: dict, body: str):
+        line = json.dumps(
+            {"endpoint": endpoint, "params": params_key(params), "body": body},
+            ensure_ascii=False
+        )
+        with self._lock:
+            # каждая запись — отдельный gzip-член, поэтому файл можно дописывать
+            with gzip.open(os.path.join(self.path, f"{endpoint}.jsonl.gz"), "at", encoding="utf-8") as file:
+                file.write(line + "\n")
+
+
+class PageReplay:
+    """
+    Чтение страниц из архива запуска вместо запросов к API.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pages = {}
+        self._lock = Lock()
+
+    def _load(self, endpoint: str) -> dict:
+        with self._lock:
+            if endpoint not in self._pages:
+                pages = {}
+                file_name = os.path.join(self.path, f"{endpoint}.jsonl.gz")
+                if os.path.exists(file_name):
+                    with gzip.open(file_name, "rt", encoding="utf-8") as file:
+                        for line in file:
+                            record = json.loads(line)
+                            pages[record["params"]] = record["body"]
+                self._pages[endpoint] = pages
+            return self._pages[endpoint]
+
+    def read(self, endpoint: str, params: dict) -> str:
+        """
+        Тело ответа, сохранённое для endpoint-а с такими параметрами.
+        """
+        try:
+            return self._load(endpoint)[params_key(params)]
+        except KeyError:
+            raise LookupError(f"Page {endpoint} {params_key(params)} is not archived in {self.path}")
@@ -0,0 +1,204 @@
+# coding: utf-8
+
+"""
+Асинхронная постраничная выгрузка с упреждающими запросами.
+
+Общее количество записей API не сообщает, поэтому одновременно
+запрашивается concurrency следующих смещений, а выгрузка останавливается
+на первой пустой странице. Страницы отдаются строго по порядку смещений.
+
+Все выгрузки процесса (ВУЗы в потоках WORKERS, этапы sync.py) идут через одну
+сессию aiohttp на долгоживущем цикле событий (async_http), поэтому keep-alive
+соединения и TLS-сессии переиспользуются, как у синхронного клиента.
+"""
+
+import asyncio
+import atexit
+import json
+from concurrent.futures import Future
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from time import time
+from typing import AsyncIterator, Iterator, Tuple
+
+import aiohttp
+
+from configs.facultetus import api_config
+from misc.client import HEADERS, RETRY_STATUSES, TOO_MANY_REQUESTS, backoff_delay, client, endpoint_url
+
+_DONE = object()
+
+
+class AsyncHttp:
+    """
+    Общая на процесс сессия aiohttp. Цикл событий работает в своём потоке до выхода
+    из процесса; корутины отправляются в него через submit из любого потока.
+    """
+
+    def __init__(self, pool_size: int):
+        self.pool_size = pool_size
+        self.loop = None
+        self._session = None
+        self._lock = Lock()
+
+    def submit(self, coroutine) -> Future:
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                Thread(target=self.loop.run_forever, name="async-http", daemon=True).start()
+                atexit.register(self.close)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Сессия; вызывается только из цикла событий, поэтому без блокировки.
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(sock_connect=client.timeout[0], sock_read=client.timeout[1]),
+            )
+        return self._session
+
+    def close(self):
+        if self.loop is None:
+            return
+        if self._session is not None:
+            self.submit(self._session.close()).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# одновременно запросов не больше, чем страниц в полёте у всех ВУЗов
+async_http = AsyncHttp(api_config.get("WORKERS", 1) * api_config.get("CONCURRENCY", 1))
+
+
+async def _fetch_page(http: aiohttp.ClientSession, endpoint: str, params: dict) -> list:
+    if client.replay:
+        return json.loads(client.replay.read(endpoint, params)).get("response") or []
+
+    # те же правила повторов и учёт времени ответа, что и у синхронного клиента
+    for attempt in range(client.retries + 1):
+        # ограничение частоты общее с синхронным клиентом и потоками ВУЗов
+        await asyncio.sleep(client.limiter.reserve(endpoint))
+        start = time()
+        try:
+            async with http.get(endpoint_url(endpoint), params=params) as response:
+                client.observe(endpoint, time() - start, params, response.status)
+                if response.status in RETRY_STATUSES and attempt < client.retries:
+                    retry_after = response.headers.get("Retry-After")
+                    if response.status == TOO_MANY_REQUESTS:
+                        client.limiter.slow_down(
+                            endpoint, backoff_delay(attempt, retry_after, client.backoff, client.max_backoff)
+                        )
+                        continue
+                else:
+                    response.raise_for_status()
+                    client.limiter.speed_up(endpoint)
+                    raw = await response.read()
+                    client.received(len(raw))
+                    body = raw.decode(response.get_encoding())
+                    if client.archive:
+                        client.archive.write(endpoint, params, body)
+                    return json.loads(body).get("response") or []
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            client.observe(endpoint, time() - start, params)
+            if attempt == client.retries:
+                raise
+            retry_after = None
+        await asyncio.sleep(backoff_delay(attempt, retry_after, client.backoff, client.max_backoff))
+
+
+async def fetch_pages(
+    endpoint: str,
+    params: dict,
+    step: int,
+    concurrency: int,
+    start: int = 0
+) -> AsyncIterator[Tuple[int, list]]:
+    """
+    Пары (смещение, записи) по порядку смещений, не больше concurrency запросов в полёте.
+    Вызывается в цикле событий async_http.
+    """
+    http = async_http.session()
+    in_flight = {}
+    next_offset = start
+
+    def schedule():
+        nonlocal next_offset
+        in_flight[next_offset] = asyncio.ensure_future(
+            _fetch_page(http, endpoint, {**params, "offset": next_offset})
+        )
+        next_offset += step
+
+    for _ in range(concurrency):
+        schedule()
+
+    offset = start
+    try:
+        while True:
+            records = await in_flight.pop(offset)
+            if not records:
+                # упреждающие запросы за концом выдачи дожидаются, а не отменяются:
+                # отменённый посреди ответа запрос закрывает своё keep-alive соединение
+                await asyncio.gather(*in_flight.values(), return_exceptions=True)
+                break
+            yield offset, records
+            schedule()
+            offset += step
+    finally:
+        for task in in_flight.values():
+            task.cancel()
+        await asyncio.gather(*in_flight.values(), return_exceptions=True)
+
+
+def iter_pages(
+    endpoint: str,
+    params: dict,
+    step: int,
+    concurrency: int,
+    start: int = 0
+) -> Iterator[Tuple[int, list]]:
+    """
+    Синхронная обёртка над fetch_pages для загрузчиков: выгрузка идёт в общем
+    цикле событий async_http, страницы передаются через ограниченную очередь.
+    """
+    pages = Queue(maxsize=concurrency)
+    stop = Event()
+
+    async def offer(item) -> bool:
+        # не блокируем цикл событий, пока загрузчик пишет предыдущую страницу
+        while not stop.is_set():
+            try:
+                pages.put_nowait(item)
+                return True
+            except Full:
+                await asyncio.sleep(0.01)
+        return False
+
+    async def produce():
+        source = fetch_pages(endpoint, params, step, concurrency, start)
+        try:
+            async for page in source:
+                if not await offer(page):
+                    return
+        except Exception as e:
+            await offer(e)
+            return
+        finally:
+            # цикл общий и не завершается: запросы в полёте отменяются сразу, а не при сборке мусора
+            await source.aclose()
+        await offer(_DONE)
+
+    producer = async_http.submit(produce())
+    try:
+        while True:
+            page = pages.get()
+            if page is _DONE:
+                break
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        stop.set()
+        producer.result()
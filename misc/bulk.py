@@ -0,0 +1,279 @@
+# coding: utf-8
+
+"""
+Пакетная запись строк в БД.
+
+Для Oracle используется MERGE с массивными биндами (executemany),
+для PostgreSQL и SQLite — INSERT ... ON CONFLICT DO UPDATE,
+для остальных СУБД — раздельные пакетные INSERT и UPDATE.
+"""
+
+import json
+from hashlib import md5
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+
+from misc.key_index import KeyIndex
+
+CHUNK_SIZE = 500
+# коды ORA-, вызванные значениями одной строки (cx_Oracle отдаёт их как DatabaseError):
+# уникальность, NULL, точность и длина, число, даты, CHECK и внешний ключ
+ORACLE_ROW_ERRORS = {1, 1400, 1407, 1438, 1722, 1830, 1840, 1841, 1843, 1858, 1861, 2290, 2291, 12899}
+
+
+def chunked(rows: list, size: int = CHUNK_SIZE) -> Iterator[list]:
+    """
+    Разбить список rows на куски длиной не больше size.
+    """
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def prepare_rows(model, rows: List[dict]) -> Tuple[List[str], List[dict]]:
+    """
+    Оставить в строках только колонки таблицы и выровнять набор ключей,
+    чтобы пачку можно было отправить одним executemany.
+    """
+    table_columns = model.__table__.columns.keys()
+    columns = [
+        column for column in table_columns
+        if any(column in row for row in rows)
+    ]
+    return columns, [{column: row.get(column) for column in columns} for row in rows]
+
+
+def fingerprint(row: dict, columns: Iterable[str]) -> str:
+    """
+    Стабильный хеш значений колонок columns строки row.
+    """
+    content = {column: row.get(column) for column in columns}
+    return md5(
+        json.dumps(content, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def existing_keys(session, model, key: str, keys: list) -> set:
+    """
+    Ключи из keys, которые уже есть в таблице модели model.
+    """
+    key_column = model.__table__.c[key]
+    return set(session.execute(select(key_column).where(key_column.in_(keys))).scalars())
+
+
+def _bind_params(row: dict, extra: dict) -> dict:
+    params = {f"b_{column}": value for column, value in row.items()}
+    params.update({f"e_{column}": value for column, value in extra.items()})
+    return params
+
+
+def _merge_oracle(session, model, key: str, columns: List[str], rows: List[dict], extra: dict):
+    preparer = session.bind.dialect.identifier_preparer
+    table = preparer.format_table(model.__table__)
+    quote = preparer.quote
+
+    # имена биндов с префиксом: часть колонок совпадает с зарезервированными словами
+    source = ", ".join(f":b_{column} AS {quote(column)}" for column in columns)
+    updates = [f"t.{quote(column)} = s.{quote(column)}" for column in columns if column != key]
+    updates += [f"t.{quote(column)} = :e_{column}" for column in extra]
+    insert_columns = ", ".join(quote(column) for column in columns)
+    insert_values = ", ".join(f"s.{quote(column)}" for column in columns)
+
+    statement = text(
+        f"MERGE INTO {table} t "
+        f"USING (SELECT {source} FROM dual) s "
+        f"ON (t.{quote(key)} = s.{quote(key)}) "
+        f"WHEN MATCHED THEN UPDATE SET {', '.join(updates)} "
+        f"WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values})"
+    )
+    session.execute(statement, [_bind_params(row, extra) for row in rows])
+
+
+def _on_conflict(session, model, key: str, columns: List[str], rows: List[dict], extra: dict, dialect):
+    statement = dialect.insert(model.__table__)
+    set_ = {column: statement.excluded[column] for column in columns if column != key}
+    set_.update(extra)
+    session.execute(
+        statement.on_conflict_do_update(index_elements=[key], set_=set_),
+        rows
+    )
+
+
+def _insert_update(session, model, key: str, columns: List[str], rows: List[dict], existing: set, extra: dict):
+    table = model.__table__
+    new_rows = [row for row in rows if row[key] not in existing]
+    old_rows = [_bind_params(row, extra) for row in rows if row[key] in existing]
+
+    if new_rows:
+        session.execute(insert(table), new_rows)
+
+    if old_rows:
+        values = {column: bindparam(f"b_{column}") for column in columns if column != key}
+        values.update({column: bindparam(f"e_{column}") for column in extra})
+        session.execute(
+            update(table).where(table.c[key] == bindparam(f"b_{key}")).values(values),
+            old_rows,
+            execution_options={"synchronize_session": False}
+        )
+
+
+def upsert_rows(
+    session,
+    model,
+    rows: List[dict],
+    key: str,
+    extra: dict = None,
+    chunk_size: int = CHUNK_SIZE,
+    index: KeyIndex = None
+) -> Tuple[int, int]:
+    """
+    Вставить или обновить строки rows в таблице модели model по ключу key.
+
+    extra — значения, которые проставляются только обновляемым строкам
+    (например, date_updated). Если передан index, существующие ключи берутся
+    из него, а не из БД, и он пополняется вставленными ключами.
+    Возвращает число добавленных и обновлённых строк.
+    """
+    extra = extra or {}
+    added, updated = 0, 0
+    dialect_name = session.bind.dialect.name
+    # дубли ключа внутри одной пачки ломают ON CONFLICT, оставляем последнюю версию
+    rows = list({row[key]: row for row in rows}.values())
+
+    for chunk in chunked(rows, chunk_size):
+        columns, chunk = prepare_rows(model, chunk)
+        if index is not None:
+            existing = {row[key] for row in chunk if row[key] in index}
+        else:
+            existing = existing_keys(session, model, key, [row[key] for row in chunk])
+        added += sum(1 for row in chunk if row[key] not in existing)
+        updated += sum(1 for row in chunk if row[key] in existing)
+
+        if dialect_name == "oracle":
+            _merge_oracle(session, model, key, columns, chunk, extra)
+        elif dialect_name == "postgresql":
+            _on_conflict(session, model, key, columns, chunk, extra, postgresql)
+        elif dialect_name == "sqlite":
+            _on_conflict(session, model, key, columns, chunk, extra, sqlite)
+        else:
+            _insert_update(session, model, key, columns, chunk, existing, extra)
+
+        if index is not None:
+            index.update(row[key] for row in chunk)
+
+    return added, updated
+
+
+def oracle_error_code(error: DBAPIError) -> int:
+    """
+    Номер ORA- ошибки драйвера Oracle или None.
+    """
+    args = getattr(error.orig, "args", None)
+    return getattr(args[0], "code", None) if args else None
+
+
+def is_row_error(error: Exception) -> bool:
+    """
+    Ошибка вызвана значениями строк (длина, тип, ограничение), а не таблицей, правами,
+    местом или соединением: только такие ошибки отбраковывают строки, остальные прерывают запись.
+    """
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return False
+        return isinstance(error, (DataError, IntegrityError)) or oracle_error_code(error) in ORACLE_ROW_ERRORS
+    if isinstance(error, StatementError):
+        # значение не прошло преобразование типа при подготовке параметров
+        return isinstance(error.orig, (TypeError, ValueError))
+    return isinstance(error, (TypeError, ValueError, KeyError))
+
+
+def write_isolated(
+    session,
+    write: Callable[[list], object],
+    rows: list,
+    on_error: Callable[[dict, Exception], None],
+    chunk_size: int = CHUNK_SIZE
+) -> list:
+    """
+    Записать rows функцией write кусками по chunk_size, каждый в своей точке сохранения.
+
+    Если кусок падает на ошибке данных (is_row_error), он делится пополам, пока плохие строки
+    не останутся по одной; они передаются в on_error(строка, ошибка), остальные
+    записываются, даже если плохими оказались все строки куска. Прочие ошибки (соединение,
+    нет таблицы или прав, кончилось место) поднимаются как есть. Возвращает результаты
+    write по записанным кускам.
+    """
+    results = []
+    for chunk in chunked(rows, chunk_size):
+        results += _write_bisect(session, write, chunk, on_error)
+    return results
+
+
+def _write_bisect(session, write: Callable, rows: list, on_error: Callable) -> list:
+    try:
+        with session.begin_nested():
+            return [write(rows)]
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(rows) == 1:
+            on_error(rows[0], e)
+            return []
+    middle = len(rows) // 2
+    return _write_bisect(session, write, rows[:middle], on_error) + \
+        _write_bisect(session, write, rows[middle:], on_error)
+
+
+def touch_rows(session, model, key: str, keys: list, values: dict, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Проставить values строкам с ключами keys одним UPDATE на пачку.
+    Нужен, чтобы отметить неизменившиеся строки без полной перезаписи.
+    """
+    key_column = model.__table__.c[key]
+    for chunk in chunked(keys, chunk_size):
+        session.execute(
+            update(model.__table__).where(key_column.in_(chunk)).values(values)
+        )
+    return len(keys)
+
+
+def sync_links(
+    session,
+    desired: KeyIndex,
+    chunk_size: int = CHUNK_SIZE,
+    where=None,
+    prune: bool = True
+) -> Tuple[int, int]:
+    """
+    Привести таблицу связей к набору ключей desired: одним пакетом вставить
+    недостающие связи и удалить лишние. Колонки связи берутся из desired.columns.
+    Условие where ограничивает сверяемую часть таблицы: связи вне её не удаляются.
+    При prune=False лишние связи не удаляются (desired заведомо неполон).
+
+    Пустой desired считается неполной выгрузкой, и тогда ничего не удаляется.
+    Возвращает число вставленных и удалённых связей.
+    """
+    columns = desired.columns
+    table = columns[0].table
+    names = [column.name for column in columns]
+    existing = KeyIndex.load(session, *columns, where=where)
+
+    to_insert = [dict(zip(names, key)) for key in desired if key not in existing]
+    to_delete = [key for key in existing if key not in desired] if prune and len(desired) else []
+
+    for chunk in chunked(to_insert, chunk_size):
+        session.execute(insert(table), chunk)
+
+    if to_delete:
+        statement = delete(table).where(
+            *[column == bindparam(f"b_{column.name}") for column in columns]
+        )
+        for chunk in chunked(to_delete, chunk_size):
+            session.execute(
+                statement,
+                [{f"b_{name}": value for name, value in zip(names, key)} for key in chunk]
+            )
+
+    return len(to_insert), len(to_delete)
@@ -0,0 +1,87 @@
+# coding: utf-8
+
+"""
+Отметки постраничной выгрузки для продолжения после сбоя (--resume).
+
+Для каждого endpoint-а и ВУЗа в facultetus_sync_checkpoint хранится смещение
+первой незаписанной страницы. Отметка пишется в той же транзакции, что и
+данные страницы, поэтому после сбоя она указывает ровно на место остановки.
+Обычный запуск начинает с нуля и стирает старые отметки, успешный — стирает
+свои в конце.
+
+    checkpoints = Checkpoints(session, "getActivities", resume=True)
+    for page in paginator.pages(checkpoints.start(university_id)):
+        write(page.records)
+        checkpoints.save(university_id, page.end)
+        session.commit()
+    checkpoints.clear()
+"""
+
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from misc.tables import FacultetusSyncCheckpoint
+
+
+def checkpoint_key(university_id) -> int:
+    """
+    Ключ отметки: id ВУЗа числом (из конфига он может прийти строкой), 0 — endpoint без ВУЗа.
+    """
+    return int(university_id or 0)
+
+
+class Checkpoints:
+    def __init__(self, session, endpoint: str, resume: bool = False):
+        self.session = session
+        self.endpoint = endpoint
+        self.offsets = {}
+        # запуск, который прервался: при продолжении вакансии отмечаются его id
+        self.run_id = None
+        if not resume:
+            self.clear()
+            return
+
+        for university_id, next_offset, run_id in session.execute(
+            select(
+                FacultetusSyncCheckpoint.university_id,
+                FacultetusSyncCheckpoint.next_offset,
+                FacultetusSyncCheckpoint.run_id
+            ).where(FacultetusSyncCheckpoint.endpoint == endpoint)
+        ):
+            self.offsets[checkpoint_key(university_id)] = next_offset
+            if run_id is not None:
+                self.run_id = max(self.run_id or run_id, run_id)
+
+    def __bool__(self):
+        return bool(self.offsets)
+
+    def start(self, university_id=None) -> int:
+        """
+        Смещение, с которого продолжать выгрузку ВУЗа university_id.
+        """
+        return self.offsets.get(checkpoint_key(university_id), 0)
+
+    def save(self, university_id, next_offset: int, run_id: int = None):
+        """
+        Отметить, что страницы ВУЗа до next_offset записаны. Коммит — за вызывающим,
+        вместе с данными страницы.
+        """
+        university_id = checkpoint_key(university_id)
+        self.offsets[university_id] = next_offset
+        self.session.merge(FacultetusSyncCheckpoint(
+            endpoint=self.endpoint,
+            university_id=university_id,
+            next_offset=next_offset,
+            run_id=run_id,
+            date_updated=datetime.now(),
+        ))
+
+    def clear(self):
+        """
+        Стереть отметки endpoint-а (коммит — за вызывающим).
+        """
+        self.offsets = {}
+        self.session.execute(
+            delete(FacultetusSyncCheckpoint).where(FacultetusSyncCheckpoint.endpoint == self.endpoint)
+        )
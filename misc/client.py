@@ -0,0 +1,207 @@
+# coding: utf-8
+
+"""
+Общий HTTP-клиент для API Facultetus.
+
+Один пул соединений с keep-alive на весь процесс, сжатие ответов,
+таймауты, повторы с экспоненциальной задержкой и разбросом на 429/5xx
+гистограммы времени ответа по каждому endpoint-у и общее на процесс
+ограничение частоты запросов (misc/ratelimit.py).
+"""
+
+import random
+from threading import Lock
+from time import perf_counter, sleep, time
+
+from requests import RequestException, Response, Session
+from requests.adapters import HTTPAdapter
+
+from configs.facultetus import api_config
+from misc.archive import PageArchive, PageReplay
+from misc.json_stream import iter_json_array
+from misc.log import logger
+from misc.metrics import LatencyHistogram, run_metrics
+from misc.profiling import spans
+from misc.ratelimit import RateLimiter
+
+try:
+    import brotli  # noqa: F401 -- requests/urllib3 распаковывают br, только если он установлен
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+BASE_URL = api_config.get("BASE_URL", "https://facultetus.ru/api")
+HEADERS = {
+    "Content-Type": "application/json; charset=UTF-8",
+    "Accept-Encoding": ACCEPT_ENCODING,
+}
+# endpoint-ы, которые авторизуются секретом, а не CLIENT_ID
+SECRET_ENDPOINTS = ("getlib", "getUniversities")
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+TOO_MANY_REQUESTS = 429
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def endpoint_url(endpoint: str) -> str:
+    key = api_config["CLIENT_SECRET"] if endpoint in SECRET_ENDPOINTS else api_config["CLIENT_ID"]
+    return f"{BASE_URL}/{key}/{endpoint}"
+
+
+def backoff_delay(attempt: int, retry_after: str = None, base: float = 0.5, cap: float = 30) -> float:
+    """
+    Задержка перед повтором номер attempt (с нуля): Retry-After, если сервер его прислал,
+    иначе экспоненциальная задержка со случайным разбросом.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class FacultetusClient:
+    """
+    Клиент API с общим пулом соединений; безопасен для использования из нескольких потоков.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: tuple = (10, 60),
+        retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        archive: PageArchive = None,
+        replay: PageReplay = None,
+        limiter: RateLimiter = None
+    ):
+        self.http = Session()
+        self.http.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.archive = archive
+        self.replay = replay
+        self.limiter = limiter or RateLimiter()
+        self.latency = {}
+        self._lock = Lock()
+
+    def observe(self, endpoint: str, seconds: float, params: dict = None, status: int = None):
+        with self._lock:
+            self.latency.setdefault(endpoint, LatencyHistogram()).observe(seconds)
+        run_metrics.observe_http(seconds)
+        # в режиме --profile каждый запрос страницы — отдельный отрезок с её параметрами
+        spans.record(endpoint, perf_counter() - seconds, seconds, status=status, **(params or {}))
+
+    def received(self, size: int):
+        """
+        Учесть в метриках объём тела ответа (после распаковки).
+        """
+        run_metrics.add("http_bytes", size)
+
+    def replayed(self, endpoint: str, params: dict) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.encoding = "utf-8"
+        response._content = self.replay.read(endpoint, params).encode("utf-8")
+        return response
+
+    def get(self, endpoint: str, params: dict = None, stream: bool = False) -> Response:
+        """
+        GET к endpoint-у с повторами на 429/5xx и сетевых ошибках.
+        В режиме воспроизведения ответ берётся из архива, а не из сети.
+        При stream=True тело не читается и не архивируется здесь.
+        """
+        if self.replay:
+            return self.replayed(endpoint, params)
+
+        for attempt in range(self.retries + 1):
+            self.limiter.wait(endpoint)
+            start = time()
+            try:
+                response = self.http.get(
+                    endpoint_url(endpoint), params=params, timeout=self.timeout, stream=stream
+                )
+            except RequestException:
+                self.observe(endpoint, time() - start, params)
+                if attempt == self.retries:
+                    raise
+                sleep(backoff_delay(attempt, base=self.backoff, cap=self.max_backoff))
+                continue
+
+            self.observe(endpoint, time() - start, params, response.status_code)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            response.close()
+            delay = backoff_delay(
+                attempt, response.headers.get("Retry-After"), base=self.backoff, cap=self.max_backoff
+            )
+            if response.status_code == TOO_MANY_REQUESTS:
+                # пауза общая для всех потоков: повтор дождётся её в limiter.wait
+                self.limiter.slow_down(endpoint, delay)
+            else:
+                sleep(delay)
+
+        if response.ok:
+            self.limiter.speed_up(endpoint)
+
+        response.raise_for_status()
+        if not stream:
+            self.received(len(response.content))
+            if self.archive:
+                self.archive.write(endpoint, params, response.text)
+        return response
+
+    def get_json(self, endpoint: str, params: dict = None) -> dict:
+        """
+        Ответ endpoint-а, разобранный ровно один раз.
+        """
+        return self.get(endpoint, params).json()
+
+    def iter_records(self, endpoint: str, params: dict = None, key: str = "response"):
+        """
+        Записи массива key из ответа по мере чтения тела, без разбора документа целиком.
+        """
+        response = self.get(endpoint, params, stream=True)
+        if self.replay:
+            yield from iter_json_array([response.content], key)
+            return
+
+        # для архива тело всё равно нужно целиком, копим его по ходу разбора
+        body = []
+
+        def tee():
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                self.received(len(chunk))
+                if self.archive:
+                    body.append(chunk)
+                yield chunk
+
+        yield from iter_json_array(tee(), key)
+        if self.archive:
+            self.archive.write(endpoint, params, b"".join(body).decode("utf-8"))
+
+    def log_summary(self, log_module: str):
+        """
+        Записать в лог и вывести гистограммы времени ответа.
+        """
+        for endpoint, histogram in sorted(self.latency.items()):
+            line = f"{endpoint}: {histogram}"
+            logger.getLogger(log_module).info(line)
+            print(f">> {line}")
+        self.limiter.log_summary(log_module)
+
+
+client = FacultetusClient(
+    pool_size=max(10, api_config.get("WORKERS", 1), api_config.get("CONCURRENCY", 1)),
+    timeout=(10, api_config.get("HTTP_TIMEOUT", 60)),
+    retries=api_config.get("HTTP_RETRIES", 5),
+    archive=PageArchive(api_config["ARCHIVE_DIR"]) if api_config.get("ARCHIVE_DIR") else None,
+    replay=PageReplay(api_config["REPLAY_DIR"]) if api_config.get("REPLAY_DIR") else None,
+    limiter=RateLimiter(api_config.get("RATE_LIMITS")),
+)
@@ -0,0 +1,100 @@
+# coding: utf-8
+
+"""
+Разбор дат и времени из ответов API.
+
+Форматы Facultetus известны заранее, поэтому для них вместо strptime
+используется fromisoformat со строгой проверкой длины и разделителей.
+Для каждого набора форматов запоминается последний подошедший, и он
+пробуется первым. Сами значения (даты, время начала) сильно повторяются,
+поэтому результаты кешируются в ограниченном LRU.
+"""
+
+from datetime import date, datetime, time
+from functools import lru_cache
+
+CACHE_SIZE = 4096
+# strptime подставляет эту дату для форматов без даты
+DEFAULT_DATE = date(1900, 1, 1)
+
+
+def _iso_datetime(s: str) -> datetime:
+    if len(s) != 19 or s[4] != "-" or s[7] != "-" or s[10] != " ":
+        raise ValueError(s)
+    return datetime.fromisoformat(s)
+
+
+def _iso_date(s: str) -> datetime:
+    if len(s) != 10 or s[4] != "-" or s[7] != "-":
+        raise ValueError(s)
+    return datetime.fromisoformat(s)
+
+
+def _iso_time(s: str) -> datetime:
+    if len(s) != 8 or s[2] != ":" or s[5] != ":":
+        raise ValueError(s)
+    return datetime.combine(DEFAULT_DATE, time.fromisoformat(s))
+
+
+# быстрые пути дают тот же результат, что и strptime с этим форматом
+FAST_PATHS = {
+    "%Y-%m-%d %H:%M:%S": _iso_datetime,
+    "%Y-%m-%d": _iso_date,
+    "%H:%M:%S": _iso_time,
+}
+
+
+class DateParser:
+    """
+    Разбор строки по первому подходящему формату из набора, с кешем результатов.
+
+    Форматы набора должны быть взаимоисключающими: подошедший в прошлый раз
+    пробуется первым, и порядок в наборе уже не задаёт приоритет.
+    """
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.winners = {}
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    @staticmethod
+    def _try(s: str, format: str):
+        fast = FAST_PATHS.get(format)
+        if fast:
+            try:
+                return fast(s)
+            except (TypeError, ValueError):
+                pass
+        try:
+            return datetime.strptime(s, format)
+        except (TypeError, ValueError):
+            return None
+
+    def _parse(self, s: str, formats: tuple):
+        winner = self.winners.get(formats)
+        if winner:
+            dt = self._try(s, winner)
+            if dt:
+                return dt
+
+        for format in formats:
+            if format == winner:
+                continue
+            dt = self._try(s, format)
+            if dt:
+                self.winners[formats] = format
+                return dt
+        return None
+
+
+date_parser = DateParser()
+
+
+def parse_datetime(s: str, formats):
+    """
+    Дата из строки s по одному формату или списку форматов; None, если ни один не подошёл.
+    """
+    if not s:
+        return None
+    if isinstance(formats, str):
+        formats = (formats,)
+    return date_parser.parse(s, tuple(formats))
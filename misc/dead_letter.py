@@ -0,0 +1,70 @@
+# coding: utf-8
+
+"""
+Отбракованные записи API.
+
+Запись, которую не удалось разобрать или записать в БД, не останавливает
+выгрузку: она сохраняется в facultetus_dead_letter вместе с JSON и ошибкой,
+а остальная пачка коммитится. Запись, уже отбракованная раньше (тот же endpoint
+и ключ), повторно не сохраняется.
+
+    dead_letters = DeadLetters(session, "getActivities", "id")
+    write_isolated(session, write, rows, dead_letters.add)
+    session.commit()
+"""
+
+import json
+
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+
+from misc.log import logger
+from misc.metrics import run_metrics
+from misc.tables import FacultetusDeadLetter
+
+
+def error_text(error: Exception) -> str:
+    # у ошибок драйвера в str() попадают SQL и все параметры пачки
+    if isinstance(error, DBAPIError) and error.orig is not None:
+        error = error.orig
+    return f"{type(error).__name__}: {error}"[:2000]
+
+
+class DeadLetters:
+    def __init__(self, session, endpoint: str, key: str, run_id: int = None):
+        self.session = session
+        self.endpoint = endpoint
+        self.key = key
+        self.run_id = run_id
+        self.count = 0
+        # ключи записей endpoint-а, уже лежащих в facultetus_dead_letter
+        self.keys = set(session.execute(
+            select(FacultetusDeadLetter.record_key).where(FacultetusDeadLetter.endpoint == endpoint)
+        ).scalars())
+
+    def add(self, record: dict, error: Exception, stage: str = "write"):
+        """
+        Отправить запись record в facultetus_dead_letter (коммит — за вызывающим).
+        Запись с тем же ключом, уже отбракованная раньше, считается, но не дублируется.
+        """
+        self.count += 1
+        run_metrics.add("rows_rejected")
+        record_key = str(record.get(self.key))[:100]
+        if record_key in self.keys:
+            return
+        self.keys.add(record_key)
+        self.session.add(FacultetusDeadLetter(
+            endpoint=self.endpoint,
+            record_key=record_key,
+            run_id=self.run_id,
+            stage=stage,
+            error=error_text(error),
+            payload=json.dumps(record, ensure_ascii=False, default=str),
+        ))
+
+    def log_summary(self, log_module: str):
+        if not self.count:
+            return
+        line = f"{self.endpoint}: {self.count} records rejected, see facultetus_dead_letter"
+        logger.getLogger(log_module).warning(line)
+        print(f">> {line}")
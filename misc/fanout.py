@@ -0,0 +1,79 @@
+# coding: utf-8
+
+"""
+Параллельная выгрузка по ВУЗам.
+
+Каждый ВУЗ выгружается функцией work в пуле из workers потоков через общий
+пул соединений клиента; всё, что work передаёт в fan_out.put, отдаётся
+вызывающему потоку по мере готовности, вперемешку между ВУЗами, через
+ограниченную очередь. После последнего элемента в fan_out.results —
+результаты work по ВУЗам в порядке keys.
+
+    fan_out = FanOut(api_config.get("WORKERS", 1))
+    for page in fan_out.run(fetch_university, university_ids):
+        write(page)
+    print(fan_out.results)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Event
+from typing import Callable, Iterator
+
+
+def put_until_stopped(queue: Queue, item, stop: Event) -> bool:
+    """
+    Положить item в ограниченную очередь queue, дожидаясь места, пока не выставлен stop.
+    Возвращает False, если item так и не положен.
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+class FanOut:
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self.results = []
+        self._items = None
+        self._stop = Event()
+
+    @property
+    def stopped(self) -> bool:
+        """
+        Выгрузка остановлена (ошибка или вызывающий перестал читать): work пора завершаться.
+        """
+        return self._stop.is_set()
+
+    def put(self, item) -> bool:
+        """
+        Отдать item вызывающему; False — выгрузка остановлена и item отброшен.
+        """
+        return put_until_stopped(self._items, item, self._stop)
+
+    def run(self, work: Callable, keys: list) -> Iterator:
+        """
+        Элементы, переданные в put вызовами work(key, self) для каждого key, по мере готовности.
+        Ошибка work поднимается здесь после последнего элемента.
+        """
+        workers = max(1, min(self.workers, len(keys)))
+        self._items = Queue(maxsize=workers * 2)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(work, key, self) for key in keys]
+            try:
+                # сначала проверяется завершение: после него очередь уже не пополнится
+                while not (all(future.done() for future in futures) and self._items.empty()):
+                    try:
+                        yield self._items.get(timeout=0.1)
+                    except Empty:
+                        continue
+                self.results = [future.result() for future in futures]
+            finally:
+                # при ошибке не даём потокам зависнуть на заполненной очереди
+                self._stop.set()
+                for future in futures:
+                    future.cancel()
@@ -1,15 +1,17 @@
 # coding: utf-8
 
-from datetime import datetime
 from functools import wraps
 from sqlalchemy import create_engine
 from sqlalchemy.orm.session import sessionmaker
 from sys import exit
 
 from configs.db import oracle_url
+from misc.dates import parse_datetime
 from misc.log import logger
+from misc.metrics import instrument_engine
 
 engine_oracle = create_engine(oracle_url, echo=False)
+instrument_engine(engine_oracle)
 factory = sessionmaker(bind=engine_oracle, autocommit=False, autoflush=False)
 session = factory()
 
@@ -33,20 +35,7 @@ def exit_on_fail(log_module: str):
 
 
 def str_to_datetaime(s: str, formats: list):
-    if not s:
-        return None
-
-    dt = None
-    for format in formats:
-        try:
-            dt = datetime.strptime(s, format)
-        except Exception:
-            pass
-     
-        if dt:
-            break
-
-    return dt
+    return parse_datetime(s, formats)
 
 
 def transform_list_to_str(elems: list, delimeter: str = ";") -> str:
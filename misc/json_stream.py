@@ -0,0 +1,108 @@
+# coding: utf-8
+
+"""
+Потоковый разбор ответа API.
+
+Ответы Facultetus — объект, в котором записи лежат в массиве (обычно "response").
+iter_json_array отдаёт элементы этого массива по мере поступления кусков тела,
+не собирая документ целиком: в памяти держится только текущая запись.
+"""
+
+import codecs
+import json
+from typing import Iterable, Iterator
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _Buffer:
+    """
+    Текст, который дочитывается из потока кусков по мере надобности.
+    """
+
+    def __init__(self, chunks: Iterable):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """
+        Дочитать следующий кусок. False, если поток закончился.
+        """
+        if self.eof:
+            return False
+        # уже разобранная часть больше не нужна
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._utf8.decode(chunk)
+            if chunk:
+                self.text += chunk
+                return True
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """
+        Следующий значимый символ (пробелы пропускаются) или пустая строка в конце потока.
+        """
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at position {self.pos} of JSON stream")
+        self.pos += 1
+
+    def value(self):
+        """
+        Разобрать очередное JSON-значение, дочитывая поток, пока оно не будет полным.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # число в самом конце буфера могло оборваться на границе куска
+            if end == len(self.text) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks: Iterable, key: str = "response") -> Iterator:
+    """
+    Элементы массива key верхнего уровня JSON-объекта, по одному, по мере разбора chunks.
+    Остальные ключи объекта разбираются и отбрасываются.
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect("{")
+    while buffer.peek() != "}":
+        if buffer.peek() == ",":
+            buffer.pos += 1
+        name = buffer.value()
+        buffer.expect(":")
+        if name == key and buffer.peek() == "[":
+            buffer.pos += 1
+            while buffer.peek() != "]":
+                if buffer.peek() == ",":
+                    buffer.pos += 1
+                    continue
+                if not buffer.peek():
+                    raise ValueError("Unexpected end of JSON stream")
+                yield buffer.value()
+            buffer.pos += 1
+        else:
+            buffer.value()
@@ -0,0 +1,69 @@
+# coding: utf-8
+
+"""
+Индекс существующих ключей таблицы в памяти.
+
+Ключи загружаются одним запросом в начале запуска и пополняются по мере
+вставки, поэтому проверка «есть ли строка» не ходит в БД.
+"""
+
+from typing import Iterable
+
+from sqlalchemy import select
+
+
+class KeyIndex:
+    """
+    Множество ключей по одной или нескольким колонкам модели.
+
+    Для составного ключа (например, employer_id и sphere_id) элементы — кортежи.
+    Значения приводятся к python-типам колонок, чтобы 1 и "1" считались одним ключом.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self._casts = [column.type.python_type for column in columns]
+        self._keys = set()
+
+    @classmethod
+    def load(cls, session, *columns, where=None) -> "KeyIndex":
+        """
+        Загрузить ключи из БД одним запросом.
+        """
+        index = cls(*columns)
+        query = select(*columns)
+        if where is not None:
+            query = query.where(where)
+        index.update(tuple(row) for row in session.execute(query))
+        return index
+
+    def key(self, value):
+        """
+        Привести значение к виду, в котором оно хранится в индексе.
+        """
+        if len(self.columns) == 1:
+            if isinstance(value, tuple):
+                (value,) = value
+            return None if value is None else self._casts[0](value)
+        return tuple(
+            None if elem is None else cast(elem)
+            for cast, elem in zip(self._casts, value)
+        )
+
+    def add(self, value):
+        self._keys.add(self.key(value))
+
+    def update(self, values: Iterable):
+        self._keys.update(self.key(value) for value in values)
+
+    def discard(self, value):
+        self._keys.discard(self.key(value))
+
+    def __contains__(self, value) -> bool:
+        return self.key(value) in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
@@ -3,18 +3,23 @@
 import logging
 import os
 
+LOG_FILE = os.getenv(
+    "FACULTETUS_LOG_FILE",
+    os.path.join(
+        "D:",
+        os.sep,
+        "YandexDisk",
+        "work",
+        "facultetus",
+        "app.log"
+    )
+)
+
 logger = logging
 logger.basicConfig(
     handlers=[
         logging.FileHandler(
-            filename=os.path.join(
-                "D:",
-                os.sep,
-                "YandexDisk",
-                "work",
-                "facultetus",
-                "app.log"
-            ),
+            filename=LOG_FILE,
             encoding="utf-8",
             mode="a+",
         )
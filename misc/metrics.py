@@ -0,0 +1,249 @@
+# coding: utf-8
+
+"""
+Метрики выгрузки по этапам и по запуску.
+
+По каждому этапу (university, spheres, vacs, events) копятся число и объём
+HTTP-запросов, гистограмма времени ответа, ожидание ограничителя частоты,
+число разобранных записей, число и время SQL-запросов и число коммитов.
+В конце запуска метрики пишутся в лог, в текстовый файл Prometheus
+(api_config["METRICS_FILE"], для textfile collector node_exporter)
+и в таблицу facultetus_sync_metrics.
+
+    with run_metrics.stage("vacs"):
+        vacs.main()
+    run_metrics.finish(session, "vacs.py")
+"""
+
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter, time
+
+from sqlalchemy import event
+
+from configs.facultetus import api_config
+from misc.log import logger
+from misc.profiling import spans
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNTERS = ("http_requests", "http_bytes", "rows_transformed", "rows_rejected", "db_statements", "commits")
+PREFIX = "facultetus_sync"
+
+
+class LatencyHistogram:
+    """
+    Гистограмма времени ответа с фиксированными корзинами (в секундах).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля по верхней границе корзины.
+        """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def __str__(self):
+        mean = self.total / self.count if self.count else 0
+        return (
+            f"{self.count} requests, mean {mean:.3f} sec, "
+            f"p50 <= {self.quantile(0.5)} sec, p95 <= {self.quantile(0.95)} sec"
+        )
+
+
+class StageMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latency = LatencyHistogram()
+        self.db_time = 0.0
+        # ожидание ограничителя частоты запросов (misc/ratelimit.py)
+        self.throttled = 0.0
+        self.duration = 0.0
+        self.ok = True
+        # запуск vacs.py (facultetus_vac_log.id), если этап его создал
+        self.vac_log_id = None
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.duration:.2f} sec, http {self.counters['http_requests']} requests "
+            f"/ {self.counters['http_bytes'] / 1024:.0f} KB (p50 <= {self.latency.quantile(0.5)} sec, "
+            f"p95 <= {self.latency.quantile(0.95)} sec, throttled {self.throttled:.2f} sec), "
+            f"{self.counters['rows_transformed']} rows ({self.counters['rows_rejected']} rejected), "
+            f"db {self.counters['db_statements']} statements / {self.db_time:.2f} sec, "
+            f"{self.counters['commits']} commits"
+        )
+
+
+class RunMetrics:
+    """
+    Метрики одного запуска. Безопасны для записи из нескольких потоков: HTTP-запросы
+    рабочих потоков относятся к этапу, который выполняется в этот момент.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time()
+        self._current = None
+        self._lock = Lock()
+
+    def current(self) -> StageMetrics:
+        """
+        Метрики текущего этапа; вне этапов — этапа "other".
+        """
+        if self._current is None:
+            self._current = self.stages.setdefault("other", StageMetrics("other"))
+        return self._current
+
+    @contextmanager
+    def stage(self, name: str):
+        metrics = self.stages.setdefault(name, StageMetrics(name))
+        previous, self._current = self._current, metrics
+        start = perf_counter()
+        try:
+            yield metrics
+        except BaseException:
+            metrics.ok = False
+            raise
+        finally:
+            metrics.duration += perf_counter() - start
+            spans.record(f"stage {name}", start, perf_counter() - start)
+            self._current = previous
+
+    def add(self, counter: str, value: int = 1):
+        with self._lock:
+            self.current().counters[counter] += value
+
+    def observe_http(self, seconds: float):
+        with self._lock:
+            metrics = self.current()
+            metrics.counters["http_requests"] += 1
+            metrics.latency.observe(seconds)
+
+    def observe_throttle(self, seconds: float):
+        with self._lock:
+            self.current().throttled += seconds
+
+    def observe_db(self, seconds: float):
+        with self._lock:
+            metrics = self.current()
+            metrics.counters["db_statements"] += 1
+            metrics.db_time += seconds
+
+    def prometheus(self) -> str:
+        """
+        Метрики запуска в текстовом формате Prometheus.
+        """
+        series = {
+            "duration_seconds": ("Stage wall time", lambda m: m.duration),
+            "success": ("1 if the stage finished without errors", lambda m: int(m.ok)),
+            "http_requests": ("HTTP requests to the Facultetus API", lambda m: m.counters["http_requests"]),
+            "http_bytes": ("Decoded HTTP response bytes", lambda m: m.counters["http_bytes"]),
+            "throttled_seconds": ("Time spent waiting for the rate limiter", lambda m: m.throttled),
+            "rows_transformed": ("Records normalized", lambda m: m.counters["rows_transformed"]),
+            "rows_rejected": ("Records sent to the dead-letter table", lambda m: m.counters["rows_rejected"]),
+            "db_statements": ("SQL statements executed", lambda m: m.counters["db_statements"]),
+            "db_seconds": ("Time spent in SQL statements", lambda m: m.db_time),
+            "commits": ("Database commits", lambda m: m.counters["commits"]),
+        }
+        lines = []
+        for name, (help_text, value) in series.items():
+            lines += [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} gauge"]
+            lines += [f'{PREFIX}_{name}{{stage="{m.name}"}} {value(m)}' for m in self.stages.values()]
+
+        name = f"{PREFIX}_http_latency_seconds"
+        lines += [f"# HELP {name} HTTP latency quantile (bucket upper bound)", f"# TYPE {name} gauge"]
+        for m in self.stages.values():
+            if m.latency.count:
+                for q in (0.5, 0.95):
+                    lines.append(f'{name}{{stage="{m.name}",quantile="{q}"}} {m.latency.quantile(q)}')
+
+        name = f"{PREFIX}_last_run_timestamp_seconds"
+        lines += [f"# HELP {name} Start time of the last run", f"# TYPE {name} gauge", f"{name} {self.started:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        # через временный файл, чтобы collector не прочитал файл наполовину
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def save(self, session):
+        """
+        Записать метрики этапов в facultetus_sync_metrics.
+        """
+        from misc.tables import FacultetusSyncMetrics
+
+        for m in self.stages.values():
+            session.add(FacultetusSyncMetrics(
+                stage=m.name,
+                vac_log_id=m.vac_log_id,
+                successfully=int(m.ok),
+                duration=m.duration,
+                http_requests=m.counters["http_requests"],
+                http_bytes=m.counters["http_bytes"],
+                http_p50=m.latency.quantile(0.5) if m.latency.count else None,
+                http_p95=m.latency.quantile(0.95) if m.latency.count else None,
+                throttle_time=m.throttled,
+                rows_transformed=m.counters["rows_transformed"],
+                rows_rejected=m.counters["rows_rejected"],
+                db_statements=m.counters["db_statements"],
+                db_time=m.db_time,
+                commits=m.counters["commits"],
+            ))
+        session.commit()
+
+    def finish(self, session, log_module: str):
+        """
+        Вывести метрики и сохранить их в файл Prometheus и в БД.
+        Ошибка сохранения метрик не считается ошибкой выгрузки.
+        """
+        for m in self.stages.values():
+            logger.getLogger(log_module).info(str(m))
+            print(f">> {m}")
+
+        try:
+            if api_config.get("METRICS_FILE"):
+                self.write_textfile(api_config["METRICS_FILE"])
+            session.rollback()
+            self.save(session)
+        except Exception:
+            session.rollback()
+            logger.getLogger(log_module).error("Metrics were not saved", exc_info=True)
+
+
+def instrument_engine(engine):
+    """
+    Считать SQL-запросы, их время и коммиты движка engine в метриках текущего этапа.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("metrics_start", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(connection, cursor, statement, parameters, context, executemany):
+        run_metrics.observe_db(perf_counter() - connection.info["metrics_start"].pop())
+
+    @event.listens_for(engine, "commit")
+    def commit(connection):
+        run_metrics.add("commits")
+
+
+run_metrics = RunMetrics()
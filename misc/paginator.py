@@ -0,0 +1,245 @@
+# coding: utf-8
+
+"""
+Постраничный обход endpoint-ов API Facultetus.
+
+Все загрузчики читают API через Paginator: страницы запрашиваются по мере
+того, как вызывающий перебирает предыдущие, поэтому в памяти одновременно
+только текущая страница (при concurrency > 1 — не больше concurrency страниц),
+сколько бы страниц ни было всего.
+
+    for page in Paginator("getPositions", {"university_id": 1}).pages():
+        write(page.records)
+
+    for event in Paginator("getActivities", {"university_id": 1}, send_limit=True).records():
+        ...
+"""
+
+from collections import namedtuple
+from threading import Lock
+from typing import Iterator
+
+from configs.facultetus import api_config
+from misc.client import client
+from misc.log import logger
+
+# last — последний кусок страницы: при потоковом разборе страница отдаётся
+# кусками по stream_batch записей, иначе каждый Page — страница целиком;
+# end — смещение сразу за полученными записями, с него продолжается выгрузка
+Page = namedtuple("Page", "offset number records last end")
+# поле-идентификатор записей endpoint-а: по нему ловятся пересечения соседних страниц
+ID_KEYS = {
+    "getPositions": "position_id",
+    "getActivities": "id",
+    "getUniversities": "university_id",
+}
+
+
+class EndpointPages:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.pages = 0
+        self.records = 0
+        # самая длинная страница, которую вернул сервер
+        self.page_size = 0
+        # записи, пришедшие повторно на соседней странице
+        self.duplicates = 0
+        # записи, пропущенные между страницами при запросах с упреждением
+        self.missing = 0
+
+    def __str__(self):
+        return (
+            f"{self.endpoint} pages: {self.pages} pages, {self.records} records, "
+            f"page size {self.page_size}, {self.duplicates} duplicates dropped, {self.missing} missing"
+        )
+
+
+class PaginationStats:
+    """
+    Страницы, записи, повторы и пропуски по endpoint-ам за весь процесс.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = Lock()
+
+    def add(self, endpoint: str, pages: int = 0, records: int = 0, duplicates: int = 0, missing: int = 0):
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointPages(endpoint))
+            stats.pages += pages
+            stats.records += records
+            stats.duplicates += duplicates
+            stats.missing += missing
+            if pages:
+                stats.page_size = max(stats.page_size, records)
+
+    def log_summary(self, log_module: str):
+        """
+        Записать в лог и вывести статистику страниц.
+        """
+        for endpoint, stats in sorted(self.endpoints.items()):
+            line = str(stats)
+            logger.getLogger(log_module).info(line)
+            print(f">> {line}")
+
+
+pagination_stats = PaginationStats()
+
+
+class Paginator:
+    """
+    Страницы endpoint-а по смещению offset до первой пустой.
+
+    Размер страницы узнаётся по ответам: смещение сдвигается на число записей,
+    которое вернул сервер, а не на запрошенное, поэтому страницы не пересекаются
+    и не оставляют пропусков, даже если сервер игнорирует limit. page_size —
+    только начальная оценка (для номеров страниц и limit). Записи, повторившие
+    запись предыдущей страницы (по полю id_key), отбрасываются и считаются.
+
+    send_limit — передавать page_size в параметре limit (getActivities);
+    concurrency > 1 — запрашивать страницы асинхронно с упреждением (misc/async_pages.py)
+    с шагом, равным размеру первой страницы;
+    stream_batch — разбирать ответ потоково и отдавать страницу кусками;
+    paged=False — endpoint без страниц (getlib): один запрос, одна страница.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        params: dict = None,
+        key: str = "response",
+        page_size: int = None,
+        send_limit: bool = False,
+        concurrency: int = 1,
+        stream_batch: int = None,
+        paged: bool = True,
+        id_key: str = None
+    ):
+        self.endpoint = endpoint
+        self.params = dict(params or {})
+        self.key = key
+        self.page_size = page_size or api_config["OFFSET"]
+        self.concurrency = concurrency
+        self.stream_batch = stream_batch
+        self.paged = paged
+        self.id_key = id_key or ID_KEYS.get(endpoint)
+        if send_limit:
+            self.params["limit"] = self.page_size
+
+    def _chunks(self, params: dict) -> Iterator[tuple]:
+        """
+        Записи одной страницы в виде пар (записи, последний ли кусок).
+        """
+        if not self.stream_batch:
+            records = client.get_json(self.endpoint, params).get(self.key)
+            if records:
+                yield records, True
+            return
+
+        # кусок отдаётся, когда пришёл следующий: так известно, последний ли он
+        batch, previous = [], None
+        for record in client.iter_records(self.endpoint, params, self.key):
+            batch.append(record)
+            if len(batch) == self.stream_batch:
+                if previous:
+                    yield previous, False
+                batch, previous = [], batch
+        if batch:
+            if previous:
+                yield previous, False
+            previous = batch
+        if previous:
+            yield previous, True
+
+    def _fresh(self, records: list, previous_ids: set, current_ids: set) -> list:
+        """
+        Записи, которых не было на предыдущей странице и выше на текущей; их id копятся в current_ids.
+        """
+        if not self.id_key:
+            return records
+        fresh = []
+        for record in records:
+            record_id = record.get(self.id_key)
+            if record_id is not None:
+                if record_id in previous_ids or record_id in current_ids:
+                    continue
+                current_ids.add(record_id)
+            fresh.append(record)
+        if len(fresh) < len(records):
+            pagination_stats.add(self.endpoint, duplicates=len(records) - len(fresh))
+        return fresh
+
+    def pages(self, start: int = 0) -> Iterator[Page]:
+        """
+        Страницы начиная со смещения start.
+        """
+        if not self.paged:
+            for records, last in self._chunks(self.params):
+                pagination_stats.add(self.endpoint, pages=int(last), records=len(records))
+                yield Page(0, 0, records, last, 0)
+            return
+
+        if self.concurrency > 1:
+            yield from self._prefetched_pages(start)
+            return
+
+        offset, number, previous_ids = start, start // self.page_size, set()
+        while True:
+            received, new, current_ids = 0, 0, set()
+            for records, last in self._chunks({**self.params, "offset": offset}):
+                received += len(records)
+                fresh = self._fresh(records, previous_ids, current_ids)
+                new += len(fresh)
+                if fresh or last:
+                    yield Page(offset, number, fresh, last, offset + received)
+            if not received:
+                return
+            pagination_stats.add(self.endpoint, pages=1, records=received)
+            if not new:
+                # сервер вернул ту же страницу ещё раз: дальше смещение не двигает выдачу
+                logger.getLogger("paginator.py").warning(
+                    f"{self.endpoint} {self.params}: page at offset {offset} repeats the previous one, stop"
+                )
+                return
+            offset += received
+            number += 1
+            previous_ids = current_ids
+
+    def _prefetched_pages(self, start: int) -> Iterator[Page]:
+        """
+        Страницы с упреждением: первая запрашивается отдельно, чтобы узнать размер страницы,
+        остальные — асинхронно с этим шагом. Страница короче шага, за которой идут
+        ещё страницы, означает пропуск: недостающие записи считаются в missing.
+        """
+        from misc.async_pages import iter_pages
+
+        number = start // self.page_size
+        records = client.get_json(self.endpoint, {**self.params, "offset": start}).get(self.key)
+        if not records:
+            return
+        step = len(records)
+        pagination_stats.add(self.endpoint, pages=1, records=step)
+        previous_ids = set()
+        yield Page(start, number, self._fresh(records, set(), previous_ids), True, start + step)
+
+        short = 0
+        for offset, records in iter_pages(self.endpoint, self.params, step, self.concurrency, start + step):
+            pagination_stats.add(self.endpoint, pages=1, records=len(records), missing=short)
+            short = max(0, step - len(records))
+            number += 1
+            current_ids = set()
+            fresh = self._fresh(records, previous_ids, current_ids)
+            if not fresh:
+                logger.getLogger("paginator.py").warning(
+                    f"{self.endpoint} {self.params}: page at offset {offset} repeats the previous one, stop"
+                )
+                return
+            yield Page(offset, number, fresh, True, offset + len(records))
+            previous_ids = current_ids
+
+    def records(self, start: int = 0) -> Iterator[dict]:
+        """
+        Записи всех страниц по одной.
+        """
+        for page in self.pages(start):
+            yield from page.records
@@ -0,0 +1,181 @@
+# coding: utf-8
+
+"""
+Конвейер выгрузки: получение → нормализация → запись.
+
+Получение и нормализация идут в отдельных потоках и связаны с записью
+ограниченными очередями: пока страница пишется в БД, следующие уже
+запрашиваются и разбираются, а при медленной записи очереди заполняются
+и сдерживают получение. Запись остаётся в вызывающем потоке — там же,
+где сессия БД.
+
+    pipeline = Pipeline("vacs")
+    for batch in pipeline.run(iter_pages(), normalize):
+        write(batch)
+    pipeline.log_summary("vacs.py")
+"""
+
+from queue import Empty, Queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import Callable, Iterable
+
+from configs.facultetus import api_config
+from misc.fanout import put_until_stopped
+from misc.log import logger
+from misc.profiling import spans
+
+DEPTH = api_config.get("PIPELINE_DEPTH", 4)
+STAGES = ("fetch", "normalize", "write")
+
+# конец данных в очереди
+_DONE = object()
+
+
+class _Failed:
+    """
+    Ошибка стадии, передаваемая по очереди до записи.
+    """
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class StageStats:
+    """
+    Время работы стадии и время простоя в ожидании соседних.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        # ждала данных от предыдущей стадии
+        self.starved = 0.0
+        # ждала места в очереди следующей стадии
+        self.blocked = 0.0
+
+
+class Pipeline:
+    def __init__(self, name: str, depth: int = DEPTH):
+        self.name = name
+        self.depth = depth
+        self.stats = {stage: StageStats(stage) for stage in STAGES}
+        self.wall = 0.0
+        self._stop = Event()
+
+    def _put(self, queue: Queue, item, stats: StageStats):
+        start = perf_counter()
+        put_until_stopped(queue, item, self._stop)
+        stats.blocked += perf_counter() - start
+
+    def _get(self, queue: Queue, stats: StageStats):
+        start = perf_counter()
+        while True:
+            try:
+                item = queue.get(timeout=0.1)
+                break
+            except Empty:
+                if self._stop.is_set():
+                    item = _DONE
+                    break
+        stats.starved += perf_counter() - start
+        return item
+
+    def _fetch(self, source: Iterable, output: Queue):
+        stats = self.stats["fetch"]
+        iterator = iter(source)
+        try:
+            while not self._stop.is_set():
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stats.busy += perf_counter() - start
+                spans.record(f"{self.name} fetch", start, perf_counter() - start, item=stats.items)
+                stats.items += 1
+                self._put(output, item, stats)
+        except Exception as e:
+            self._put(output, _Failed(e), stats)
+            return
+        finally:
+            # генератор закрывается в своём потоке, чтобы его finally отработал здесь
+            if hasattr(iterator, "close"):
+                iterator.close()
+        self._put(output, _DONE, stats)
+
+    def _normalize(self, normalize: Callable, source: Queue, output: Queue):
+        stats = self.stats["normalize"]
+        while True:
+            item = self._get(source, stats)
+            if item is _DONE or isinstance(item, _Failed):
+                self._put(output, item, stats)
+                return
+            start = perf_counter()
+            try:
+                item = normalize(item)
+            except Exception as e:
+                self._put(output, _Failed(e), stats)
+                return
+            finally:
+                stats.busy += perf_counter() - start
+            spans.record(f"{self.name} normalize", start, perf_counter() - start, item=stats.items)
+            stats.items += 1
+            self._put(output, item, stats)
+
+    def run(self, source: Iterable, normalize: Callable = None):
+        """
+        Элементы source, прошедшие через normalize, по мере готовности.
+
+        source перебирается в отдельном потоке, normalize — в другом; тело цикла
+        вызывающего считается стадией записи. Ошибка любой стадии поднимается здесь.
+        """
+        start = perf_counter()
+        fetched, normalized = Queue(maxsize=self.depth), Queue(maxsize=self.depth)
+        threads = [
+            Thread(target=self._fetch, args=(source, fetched), name=f"{self.name}-fetch", daemon=True),
+            Thread(
+                target=self._normalize,
+                args=(normalize or (lambda item: item), fetched, normalized),
+                name=f"{self.name}-normalize",
+                daemon=True
+            ),
+        ]
+        for thread in threads:
+            thread.start()
+
+        stats = self.stats["write"]
+        try:
+            while True:
+                item = self._get(normalized, stats)
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.error
+                write_start = perf_counter()
+                yield item
+                stats.busy += perf_counter() - write_start
+                spans.record(f"{self.name} write", write_start, perf_counter() - write_start, item=stats.items)
+                stats.items += 1
+        finally:
+            # при ошибке записи останавливаем остальные стадии
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.wall = perf_counter() - start
+
+    def log_summary(self, log_module: str):
+        """
+        Записать в лог и вывести загрузку стадий: доля времени в работе и в ожидании соседей.
+        """
+        wall = self.wall or 1e-9
+        for stats in self.stats.values():
+            line = (
+                f"{self.name} {stats.name}: {stats.items} items, "
+                f"busy {stats.busy:.2f} sec ({stats.busy / wall:.0%}), "
+                f"waited for input {stats.starved:.2f} sec, for output {stats.blocked:.2f} sec"
+            )
+            logger.getLogger(log_module).info(line)
+            print(f">> {line}")
@@ -0,0 +1,170 @@
+# coding: utf-8
+
+"""
+Профилирование выгрузок (--profile).
+
+За время запуска пишутся три файла с общим префиксом:
+
+- <префикс>.prof — детерминированный профиль cProfile главного потока
+  (snakeviz, python -m pstats);
+- <префикс>.folded — свёрнутые стеки всех потоков, снятые сэмплированием
+  (flamegraph.pl, speedscope, inferno);
+- <префикс>.trace.json — отрезки времени по страницам и стадиям: HTTP-запросы,
+  получение/нормализация/запись в конвейере, этапы, обновление представления
+  (chrome://tracing, Perfetto).
+
+Вне --profile отрезки не копятся, и spans.record почти ничего не стоит.
+"""
+
+import cProfile
+import json
+import os
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Event, Lock, Thread, current_thread, enumerate as threads, get_ident
+from time import perf_counter
+
+from misc.log import logger
+
+SAMPLE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
+
+
+class Spans:
+    """
+    Отрезки времени в формате Chrome trace; копятся, только пока идёт профилирование.
+    """
+
+    def __init__(self):
+        self.events = None
+        self.origin = perf_counter()
+        self._lock = Lock()
+
+    def start(self):
+        self.origin = perf_counter()
+        self.events = []
+
+    def record(self, name: str, start: float, duration: float, **args):
+        """
+        Записать отрезок, начавшийся в start (perf_counter) и длившийся duration секунд.
+        """
+        if self.events is None:
+            return
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": get_ident(),
+            "args": {key: value for key, value in args.items() if value is not None},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, perf_counter() - start, **args)
+
+    def dump(self, path: str, thread_names: dict):
+        events, self.events = self.events or [], None
+        # имена потоков, чтобы в просмотрщике было видно, где получение, а где запись
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+            for ident, name in thread_names.items()
+        ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events}, file, default=str)
+
+
+class StackSampler(Thread):
+    """
+    Раз в interval секунд снимает стеки всех потоков и считает одинаковые.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_names = {}
+        self._stop_event = Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threads() if thread.ident}
+        self.thread_names.update(names)
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(name.replace(";", ",") for name in reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+spans = Spans()
+
+
+def add_argument(parser):
+    """
+    Добавить в parser флаг --profile [КАТАЛОГ].
+    """
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PROFILE_DIR,
+        metavar="DIR",
+        help=f"профилировать запуск и сохранить результаты в DIR (по умолчанию {PROFILE_DIR}/)",
+    )
+
+
+@contextmanager
+def profiled(directory: str, name: str):
+    """
+    Профилировать блок, если задан каталог directory; файлы называются <name>-<время запуска>.
+    """
+    if not directory:
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+    profile = cProfile.Profile()
+    sampler = StackSampler()
+    spans.start()
+    sampler.start()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        sampler.stop()
+        sampler.thread_names[get_ident()] = current_thread().name
+        profile.dump_stats(f"{prefix}.prof")
+        sampler.dump(f"{prefix}.folded")
+        spans.dump(f"{prefix}.trace.json", sampler.thread_names)
+
+        line = f"Profile saved: {prefix}.prof, {prefix}.folded, {prefix}.trace.json"
+        logger.getLogger(f"{name}.py").info(line)
+        print(f">> {line}")
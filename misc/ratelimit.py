@@ -0,0 +1,134 @@
+# coding: utf-8
+
+"""
+Ограничение частоты запросов к API на весь процесс.
+
+У каждого endpoint-а своё ведро токенов: rate запросов в секунду в среднем
+и не больше burst подряд (api_config["RATE_LIMITS"]). Все пути получения
+(синхронный клиент, асинхронное упреждение, потоки ВУЗов) берут токен
+из общего ведра перед каждым запросом. На 429 ведро ставится на паузу
+(по Retry-After или задержке повтора) и вдвое снижает частоту; успешные
+ответы постепенно возвращают её к заданной.
+
+    api_config["RATE_LIMITS"] = {"getPositions": {"rate": 5, "burst": 10}}
+
+Ограничитель процесса — client.limiter (misc/client.py).
+"""
+
+from threading import Lock
+from time import monotonic, sleep
+
+from misc.log import logger
+from misc.metrics import run_metrics
+
+# ниже этой доли заданной частоты ведро не замедляется
+MIN_RATE_FRACTION = 0.1
+# на какую долю заданной частоты ускоряется ведро после успешного ответа
+RECOVERY_FRACTION = 0.05
+
+
+class TokenBucket:
+    """
+    Ведро токенов одного endpoint-а; rate=None — без ограничения частоты, только паузы на 429.
+    """
+
+    def __init__(self, rate: float = None, burst: int = 1):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        # суммарное ожидание и число запросов, которым пришлось ждать
+        self.waited = 0.0
+        self.delayed = 0
+        self.limited = 0
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """
+        Занять токен и вернуть, сколько секунд ждать до запроса.
+        """
+        with self._lock:
+            now = monotonic()
+            delay = 0.0
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # токен берётся в долг: следующий запрос подождёт дольше
+                self.tokens -= 1
+                if self.tokens < 0:
+                    delay = -self.tokens / self.rate
+            delay = max(delay, self.paused_until - now)
+            if delay > 0:
+                self.waited += delay
+                self.delayed += 1
+            return delay
+
+    def slow_down(self, pause: float):
+        """
+        Сервер ответил 429: приостановить запросы на pause секунд и снизить частоту.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, monotonic() + pause)
+            self.limited += 1
+            if self.rate:
+                self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def speed_up(self):
+        if self.rate and self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict = None):
+        self.limits = limits or {}
+        self.buckets = {}
+        self._lock = Lock()
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        with self._lock:
+            if endpoint not in self.buckets:
+                limit = self.limits.get(endpoint) or {}
+                self.buckets[endpoint] = TokenBucket(limit.get("rate"), limit.get("burst", 1))
+            return self.buckets[endpoint]
+
+    def reserve(self, endpoint: str) -> float:
+        """
+        Занять токен endpoint-а; возвращает задержку для асинхронного ожидания.
+        """
+        delay = self.bucket(endpoint).reserve()
+        if delay > 0:
+            run_metrics.observe_throttle(delay)
+        return delay
+
+    def wait(self, endpoint: str):
+        """
+        Дождаться токена endpoint-а в текущем потоке.
+        """
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            sleep(delay)
+
+    def slow_down(self, endpoint: str, pause: float):
+        self.bucket(endpoint).slow_down(pause)
+
+    def speed_up(self, endpoint: str):
+        self.bucket(endpoint).speed_up()
+
+    def log_summary(self, log_module: str):
+        """
+        Записать в лог и вывести время ожидания по endpoint-ам.
+        """
+        for endpoint, bucket in sorted(self.buckets.items()):
+            if not (bucket.delayed or bucket.limited):
+                continue
+            rate = f"{bucket.rate:.2f}/{bucket.max_rate} req/sec" if bucket.rate else "unlimited"
+            line = (
+                f"{endpoint} throttled: {bucket.waited:.2f} sec over {bucket.delayed} requests, "
+                f"{bucket.limited} responses 429, rate {rate}"
+            )
+            logger.getLogger(log_module).info(line)
+            print(f">> {line}")
+
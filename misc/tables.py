@@ -1,6 +1,6 @@
 # coding: utf-8
 
-from sqlalchemy import Column, ForeignKey, Integer, TIMESTAMP, VARCHAR, text, DateTime
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, TIMESTAMP, Text, VARCHAR, text, DateTime
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -80,6 +80,40 @@ class FacultetusActivity(Base):
     type1 = relationship("FacultetusActivityType")
 
 
+class FacultetusActivitySync(Base):
+    __tablename__ = "facultetus_activity_sync"
+    __table_args__ = {"schema": "apiuser"}
+
+    university_id = Column(Integer, primary_key=True, comment="ID университета")
+    watermark = Column(TIMESTAMP, comment="Максимальная дата создания загруженных событий")
+    date_updated = Column(TIMESTAMP)
+
+
+class FacultetusSyncCheckpoint(Base):
+    __tablename__ = "facultetus_sync_checkpoint"
+    __table_args__ = {"schema": "apiuser"}
+
+    endpoint = Column(VARCHAR(50), primary_key=True, comment="Endpoint API")
+    university_id = Column(Integer, primary_key=True, comment="ID университета, 0 — для endpoint-а без университета")
+    next_offset = Column(Integer, comment="Смещение первой незаписанной страницы")
+    run_id = Column(Integer, comment="Запуск, записавший отметку (для вакансий — facultetus_vac_log.id)")
+    date_updated = Column(TIMESTAMP)
+
+
+class FacultetusDeadLetter(Base):
+    __tablename__ = "facultetus_dead_letter"
+    __table_args__ = {"schema": "apiuser"}
+
+    id = Column(Integer, primary_key=True)
+    endpoint = Column(VARCHAR(50), comment="Endpoint API, из которого пришла запись")
+    record_key = Column(VARCHAR(100), comment="Идентификатор записи в API")
+    run_id = Column(Integer, comment="Запуск (для вакансий — facultetus_vac_log.id)")
+    stage = Column(VARCHAR(20), comment="На чём запись отбракована: normalize или write")
+    error = Column(VARCHAR(2000), comment="Ошибка")
+    payload = Column(Text, comment="Запись в JSON в том виде, в каком её пытались разобрать или записать")
+    date_added = Column(TIMESTAMP, server_default=text("sysdate"))
+
+
 class FacultetusUniversity(Base):
     __tablename__ = "facultetus_university"
     __table_args__ = {"schema": "apiuser"}
@@ -105,7 +139,11 @@ class FacultetusUniversity(Base):
 
 class FacultetusVac(Base):
     __tablename__ = "facultetus_vac"
-    __table_args__ = {"schema": "apiuser"}
+    __table_args__ = (
+        # отметка удалённых: живые вакансии, не отмеченные текущим запуском
+        Index("ix_facultetus_vac_live_run", "date_deleted", "sync_run_id"),
+        {"schema": "apiuser"},
+    )
 
     position_id = Column(Integer, primary_key=True, comment="Идентификатор вакансии")
     employer_id = Column(Integer, comment="Идентификатор организации")
@@ -145,6 +183,14 @@ class FacultetusVac(Base):
     date_added = Column(TIMESTAMP, server_default=text("sysdate"))
     date_updated = Column(TIMESTAMP)
     date_deleted = Column(TIMESTAMP)
+    content_hash = Column(VARCHAR(32), comment="Хеш содержимого вакансии")
+    sync_run_id = Column(
+        Integer,
+        nullable=False,
+        server_default=text("0"),
+        index=True,
+        comment="Последний запуск vacs.py (facultetus_vac_log.id), в котором вакансия пришла из API; 0 — ни в одном"
+    )
 
 
 class FacultetusSphere(Base):
@@ -178,6 +224,16 @@ class FacultetusVacSphere(Base):
     date_added = Column(TIMESTAMP, nullable=False, server_default=text("sysdate "))
 
 
+class FacultetusVacUniversity(Base):
+    __tablename__ = "facultetus_vac_university"
+    __table_args__ = {"schema": "apiuser"}
+
+    id = Column(Integer, primary_key=True)
+    university_id = Column(ForeignKey("apiuser.facultetus_university.university_id"))
+    position_id = Column(Integer, comment="Идентификатор вакансии")
+    date_added = Column(TIMESTAMP, nullable=False, server_default=text("sysdate "))
+
+
 class FacultetusVacLog(Base):
     __tablename__ = "facultetus_vac_log"
     __table_args__ = {"schema": "apiuser"}
@@ -185,6 +241,30 @@ class FacultetusVacLog(Base):
     id = Column(Integer, primary_key=True)
     added = Column(Integer)
     updated = Column(Integer)
+    unchanged = Column(Integer)
     deleted = Column(Integer)
     successfully = Column(Integer)
     date_added = Column(TIMESTAMP, nullable=False, server_default=text("sysdate "))
+    mv_refresh_time = Column(Float, comment="Длительность обновления mv_facultetus_employer, сек; пусто, если не обновлялось")
+
+
+class FacultetusSyncMetrics(Base):
+    __tablename__ = "facultetus_sync_metrics"
+    __table_args__ = {"schema": "apiuser"}
+
+    id = Column(Integer, primary_key=True)
+    stage = Column(VARCHAR(20), comment="Этап выгрузки: university, spheres, vacs, events")
+    vac_log_id = Column(ForeignKey("apiuser.facultetus_vac_log.id"), comment="Запуск vacs.py, если этап его создал")
+    successfully = Column(Integer)
+    duration = Column(Float, comment="Длительность этапа, сек")
+    http_requests = Column(Integer, comment="Запросов к API")
+    http_bytes = Column(Integer, comment="Объём ответов API после распаковки, байт")
+    http_p50 = Column(Float, comment="Медиана времени ответа API (верхняя граница корзины), сек")
+    http_p95 = Column(Float, comment="95-й перцентиль времени ответа API (верхняя граница корзины), сек")
+    throttle_time = Column(Float, comment="Ожидание ограничителя частоты запросов, сек")
+    rows_transformed = Column(Integer, comment="Разобрано записей")
+    rows_rejected = Column(Integer, comment="Записей отправлено в facultetus_dead_letter")
+    db_statements = Column(Integer, comment="SQL-запросов")
+    db_time = Column(Float, comment="Время в SQL-запросах, сек")
+    commits = Column(Integer, comment="Коммитов")
+    date_added = Column(TIMESTAMP, nullable=False, server_default=text("sysdate "))
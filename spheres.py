@@ -4,42 +4,60 @@
 Все сферы.
 """
 
-from requests import get
+from argparse import ArgumentParser
+from sqlalchemy import select
 from time import time
 
-from configs.facultetus import api_config
+from misc.client import client
 from misc.helpers import exit_on_fail, session
+from misc.key_index import KeyIndex
 from misc.log import logger
+from misc.metrics import run_metrics
+from misc.paginator import Paginator, pagination_stats
+from misc.profiling import add_argument as add_profile_argument, profiled
 from misc.tables import FacultetusSphere
 
 
-@exit_on_fail("spheres.py")
-def main():
-    response = get(
-        url=f"https://facultetus.ru/api/{api_config['CLIENT_SECRET']}/getlib",
-        headers={
-            "Content-Type": "application/json; charset=UTF-8",
-        },
-        params={"lib": "spheres"}
-    )
-
-    if not response.json().get("spheres"):
-        return
-
-    for sp in response.json()['spheres']:
-        if (
-            not session.query(FacultetusSphere)
-            .filter(FacultetusSphere.name == sp)
-            .one_or_none()
-        ):
+def sync_spheres() -> dict:
+    """
+    Дополнить facultetus_sphere сферами из getlib.
+    Возвращает словарь название сферы -> id или пустой словарь, если API сфер не вернул.
+    """
+    spheres = list(Paginator("getlib", {"lib": "spheres"}, key="spheres", paged=False).records())
+
+    if not spheres:
+        return {}
+
+    run_metrics.add("rows_transformed", len(spheres))
+    sphere_names = KeyIndex.load(session, FacultetusSphere.name)
+    for sp in spheres:
+        if sp not in sphere_names:
             session.add(FacultetusSphere(name=sp))
+            sphere_names.add(sp)
     session.commit()
 
+    return dict(session.execute(select(FacultetusSphere.name, FacultetusSphere.id)).all())
+
+
+@exit_on_fail("spheres.py")
+def main():
+    return sync_spheres()
+
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Сферы из getlib.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     start = time()
-    main()
+    try:
+        with profiled(args.profile, "spheres"), run_metrics.stage("spheres"):
+            main()
+    finally:
+        run_metrics.finish(session, "spheres.py")
     end = time()
     time_spent = f"Total time spent: {end - start} sec"
     logger.getLogger("spheres.py").info(time_spent)
     print(f">> {time_spent} sec")
+    client.log_summary("spheres.py")
+    pagination_stats.log_summary("spheres.py")
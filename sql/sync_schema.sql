@@ -0,0 +1,97 @@
+-- Изменения схемы apiuser для выгрузок Facultetus (Oracle 12c+).
+-- Выполняются один раз, по порядку, до первого запуска новой версии загрузчиков.
+-- Суррогатные id — identity-колонки: модели в misc/tables.py не задают
+-- последовательностей, значение id выдаёт БД.
+
+
+-- Хеш содержимого вакансии: неизменившиеся вакансии не перезаписываются
+ALTER TABLE apiuser.facultetus_vac ADD content_hash VARCHAR2(32);
+ALTER TABLE apiuser.facultetus_vac_log ADD unchanged NUMBER(10);
+
+
+-- Отметки инкрементальной выгрузки мероприятий
+CREATE TABLE apiuser.facultetus_activity_sync (
+    university_id NUMBER(10) PRIMARY KEY,
+    watermark     TIMESTAMP,
+    date_updated  TIMESTAMP
+);
+COMMENT ON COLUMN apiuser.facultetus_activity_sync.watermark IS 'Максимальная дата создания загруженных событий';
+
+
+-- Удалённые вакансии отмечаются по запуску (facultetus_vac_log.id), а не по времени.
+-- Отметка удалённых — date_deleted IS NULL AND sync_run_id < :run_id: диапазон по
+-- (date_deleted, sync_run_id). NOT NULL нужен, чтобы в индекс попадали все живые строки
+-- (строка, где обе колонки NULL, в B-tree Oracle не индексируется); 0 — ни в одном запуске.
+ALTER TABLE apiuser.facultetus_vac ADD sync_run_id NUMBER(10) DEFAULT 0 NOT NULL;
+CREATE INDEX apiuser.ix_facultetus_vac_sync_run_id ON apiuser.facultetus_vac (sync_run_id);
+CREATE INDEX apiuser.ix_facultetus_vac_live_run ON apiuser.facultetus_vac (date_deleted, sync_run_id);
+
+
+-- Длительность обновления mv_facultetus_employer; пусто, если не обновлялось
+ALTER TABLE apiuser.facultetus_vac_log ADD mv_refresh_time FLOAT;
+
+
+-- Связи ВУЗ — вакансия при выгрузке вакансий по нескольким ВУЗам
+CREATE TABLE apiuser.facultetus_vac_university (
+    id            NUMBER(10) GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    university_id NUMBER(10) REFERENCES apiuser.facultetus_university (university_id),
+    position_id   NUMBER(10),
+    date_added    TIMESTAMP DEFAULT sysdate NOT NULL
+);
+CREATE INDEX apiuser.ix_facultetus_vac_univ_uid ON apiuser.facultetus_vac_university (university_id);
+
+
+-- Метрики этапов выгрузки: строка на этап каждого запуска
+CREATE TABLE apiuser.facultetus_sync_metrics (
+    id               NUMBER(10) GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    stage            VARCHAR2(20),
+    vac_log_id       NUMBER(10) REFERENCES apiuser.facultetus_vac_log (id),
+    successfully     NUMBER(10),
+    duration         FLOAT,
+    http_requests    NUMBER(10),
+    http_bytes       NUMBER(19),
+    http_p50         FLOAT,
+    http_p95         FLOAT,
+    throttle_time    FLOAT,
+    rows_transformed NUMBER(10),
+    rows_rejected    NUMBER(10),
+    db_statements    NUMBER(10),
+    db_time          FLOAT,
+    commits          NUMBER(10),
+    date_added       TIMESTAMP DEFAULT sysdate NOT NULL
+);
+COMMENT ON COLUMN apiuser.facultetus_sync_metrics.stage IS 'Этап выгрузки: university, spheres, vacs, events';
+COMMENT ON COLUMN apiuser.facultetus_sync_metrics.vac_log_id IS 'Запуск vacs.py, если этап его создал';
+COMMENT ON COLUMN apiuser.facultetus_sync_metrics.http_bytes IS 'Объём ответов API после распаковки, байт';
+COMMENT ON COLUMN apiuser.facultetus_sync_metrics.throttle_time IS 'Ожидание ограничителя частоты запросов, сек';
+
+
+-- Отметки постраничной выгрузки для продолжения после сбоя (--resume)
+CREATE TABLE apiuser.facultetus_sync_checkpoint (
+    endpoint      VARCHAR2(50),
+    university_id NUMBER(10),
+    next_offset   NUMBER(10),
+    run_id        NUMBER(10),
+    date_updated  TIMESTAMP,
+    CONSTRAINT pk_facultetus_sync_checkpoint PRIMARY KEY (endpoint, university_id)
+);
+COMMENT ON COLUMN apiuser.facultetus_sync_checkpoint.university_id IS 'ID университета, 0 — для endpoint-а без университета';
+COMMENT ON COLUMN apiuser.facultetus_sync_checkpoint.next_offset IS 'Смещение первой незаписанной страницы';
+COMMENT ON COLUMN apiuser.facultetus_sync_checkpoint.run_id IS 'Запуск, записавший отметку (для вакансий — facultetus_vac_log.id)';
+
+
+-- Отбракованные записи API: не разобрались или не записались в БД
+CREATE TABLE apiuser.facultetus_dead_letter (
+    id         NUMBER(10) GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    endpoint   VARCHAR2(50),
+    record_key VARCHAR2(100),
+    run_id     NUMBER(10),
+    stage      VARCHAR2(20),
+    error      VARCHAR2(2000),
+    payload    CLOB,
+    date_added TIMESTAMP DEFAULT sysdate
+);
+CREATE INDEX apiuser.ix_facultetus_dead_letter_key ON apiuser.facultetus_dead_letter (endpoint, record_key);
+COMMENT ON COLUMN apiuser.facultetus_dead_letter.run_id IS 'Запуск (для вакансий — facultetus_vac_log.id)';
+COMMENT ON COLUMN apiuser.facultetus_dead_letter.stage IS 'На чём запись отбракована: normalize или write';
+COMMENT ON COLUMN apiuser.facultetus_dead_letter.payload IS 'Запись в JSON в том виде, в каком её пытались разобрать или записать';
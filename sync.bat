@@ -0,0 +1,2 @@
+"C:\Users\blinov.2016\Miniconda3\python.exe" "D:\YandexDisk\work\facultetus\sync.py"
+pause
\ No newline at end of file
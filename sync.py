@@ -0,0 +1,130 @@
+# coding: utf-8
+
+"""
+Все выгрузки Facultetus в одном процессе.
+
+Этапы идут по порядку (ВУЗы, сферы, вакансии, мероприятия) через общие
+движок, пул соединений и HTTP-клиент. Сферы и ВУЗы, выгруженные на своих
+этапах, передаются следующим, а не перечитываются. Сбой этапа не отменяет
+остальные: им хватит данных из БД.
+
+    python sync.py
+    python sync.py --stages vacs,events --full
+    python sync.py --resume
+    python sync.py --profile
+"""
+
+from argparse import ArgumentParser
+from sys import exit
+from time import time
+
+from misc.client import client
+from misc.helpers import session
+from misc.log import logger
+from misc.metrics import run_metrics
+from misc.paginator import pagination_stats
+from misc.profiling import add_argument as add_profile_argument, profiled
+
+STAGES = ("university", "spheres", "vacs", "events")
+
+
+def run_stage(name: str, func, timings: list):
+    """
+    Выполнить этап, записать его длительность и результат. При ошибке возвращает None.
+    """
+    print(f"=== {name} ===")
+    start = time()
+    try:
+        with run_metrics.stage(name):
+            result = func()
+        ok = True
+    except Exception as e:
+        session.rollback()
+        error_text = f"Stage {name} failed"
+        logger.getLogger("sync.py").error(error_text, exc_info=True)
+        print(f">>> {error_text}: {repr(e)}")
+        result, ok = None, False
+
+    seconds = time() - start
+    timings.append((name, ok, seconds))
+    logger.getLogger("sync.py").info(f"Stage {name}: {'ok' if ok else 'failed'}, {seconds:.1f} sec")
+    return result
+
+
+def print_timings(timings: list):
+    print(f"{'stage':<11} {'ok':<3} {'time,s':>9}")
+    for name, ok, seconds in timings:
+        print(f"{name:<11} {'+' if ok else '-':<3} {seconds:>9.2f}")
+
+
+def main(stages: list, full: bool = False, resume: bool = False) -> bool:
+    """
+    Выполнить этапы stages. Возвращает True, если все прошли успешно.
+    При resume=True постраничные этапы продолжаются с места сбоя прошлого запуска.
+    """
+    timings = []
+    universities, spheres, refresh = None, None, None
+
+    # модули загрузчиков импортируются здесь, чтобы неиспользуемые не загружались
+    if "university" in stages:
+        from university import sync_universities
+        universities = run_stage("university", lambda: sync_universities(resume), timings)
+
+    if "spheres" in stages:
+        from spheres import sync_spheres
+        spheres = run_stage("spheres", sync_spheres, timings)
+
+    if "vacs" in stages:
+        import vacs
+        refresh = run_stage("vacs", lambda: vacs.main(spheres, universities, resume), timings)
+
+    if "events" in stages:
+        from events import sync_events
+        run_stage("events", lambda: sync_events(full, universities, resume), timings)
+
+    # mv_facultetus_employer обновлялось в фоне, пока шли мероприятия
+    if refresh:
+        start = time()
+        refresh.join()
+        timings.append(("mv wait", True, time() - start))
+
+    print_timings(timings)
+    return all(ok for _, ok, _ in timings)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Выгрузки Facultetus в одном процессе.")
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help=f"этапы через запятую, по умолчанию все: {','.join(STAGES)}",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="перечитать историю мероприятий всех ВУЗов целиком",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить ВУЗы, вакансии и мероприятия с места сбоя прошлого запуска",
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    start = time()
+    with profiled(args.profile, "sync"):
+        ok = main(stages, full=args.full, resume=args.resume)
+    end = time()
+    time_spent = f"Total time spent: {end - start} sec"
+    logger.getLogger("sync.py").info(time_spent)
+    print(f">> {time_spent}")
+    client.log_summary("sync.py")
+    pagination_stats.log_summary("sync.py")
+    run_metrics.finish(session, "sync.py")
+    if not ok:
+        exit(1)
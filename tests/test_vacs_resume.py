@@ -0,0 +1,95 @@
+# coding: utf-8
+
+"""
+Продолжение выгрузки вакансий (vacs.py --resume) после сбоя на локальной замене API.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+import types
+
+import pytest
+from sqlalchemy import func, select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="module")
+def env():
+    """
+    Замена API и чистая схема SQLite; настройки подставляются вместо configs/, как в bench/run.py.
+    """
+    from bench.fake_api import FakeConfig, start
+    from bench.run import attach_schema, create_schema
+
+    directory = tempfile.mkdtemp()
+    os.environ.setdefault("FACULTETUS_LOG_FILE", os.path.join(directory, "app.log"))
+    db_url = f"sqlite:///{os.path.join(directory, 'test.db')}"
+    config = FakeConfig(positions=100, page_size=20)
+    server = start(config)
+
+    configs = types.ModuleType("configs")
+    configs_db = types.ModuleType("configs.db")
+    configs_db.oracle_url = db_url
+    configs_facultetus = types.ModuleType("configs.facultetus")
+    configs_facultetus.api_config = {
+        "BASE_URL": f"http://127.0.0.1:{server.server_port}/api",
+        "CLIENT_ID": "test",
+        "CLIENT_SECRET": "test",
+        "UNIVERSITY_ID": 1,
+        "OFFSET": 20,
+        "LIMIT": 20,
+    }
+    sys.modules.update({
+        "configs": configs,
+        "configs.db": configs_db,
+        "configs.facultetus": configs_facultetus,
+    })
+
+    create_schema(db_url)
+    from misc import helpers
+    attach_schema(helpers.engine_oracle)
+    import vacs
+
+    yield config, vacs, helpers.session
+    server.shutdown()
+
+
+def test_resume_after_last_page_deletes_outdated(env, monkeypatch):
+    config, vacs, session = env
+    from misc.tables import FacultetusVac, FacultetusVacLog
+
+    def deleted_count():
+        return session.execute(
+            select(func.count()).select_from(FacultetusVac).where(FacultetusVac.date_deleted.is_not(None))
+        ).scalar()
+
+    vacs.main()
+    config.positions = 80
+    vacs.main()
+    assert deleted_count() == 20
+
+    # все страницы записаны, сбой — на сверке связей перед отметкой удалённых
+    config.positions = 60
+
+    def failing_sync_links(*args, **kwargs):
+        raise RuntimeError("sync_links failed")
+
+    monkeypatch.setattr(vacs, "sync_links", failing_sync_links)
+    with pytest.raises(RuntimeError):
+        vacs.main()
+    session.rollback()
+    monkeypatch.undo()
+
+    # продолжение получает только пустую страницу, но удаляет вакансии, которых нет в API
+    vacs.main(resume=True)
+    run = session.execute(select(FacultetusVacLog).order_by(FacultetusVacLog.id.desc())).scalars().first()
+    session.refresh(run)
+    assert run.successfully == 1
+    assert run.deleted == 20
+    assert (run.added, run.updated, run.unchanged) == (0, 0, 60)
+    assert deleted_count() == 40
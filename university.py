@@ -4,50 +4,79 @@
 Все университеты.
 """
 
-from requests import get
+from argparse import ArgumentParser
 from time import time
 
-from configs.facultetus import api_config
+from misc.checkpoint import Checkpoints
+from misc.client import client
 from misc.helpers import exit_on_fail, session
+from misc.key_index import KeyIndex
 from misc.log import logger
+from misc.metrics import run_metrics
+from misc.paginator import Paginator, pagination_stats
+from misc.pipeline import Pipeline
+from misc.profiling import add_argument as add_profile_argument, profiled
 from misc.tables import FacultetusUniversity
 
 
-@exit_on_fail("university.py")
-def main():
-    current_offset = 0
-    while True:
-        print(f"> Page {int(current_offset / (api_config['OFFSET'] + 30))}...")
-        response = get(
-            url=f"https://facultetus.ru/api/{api_config['CLIENT_SECRET']}/getUniversities",
-            headers={
-                "Content-Type": "application/json; charset=UTF-8",
-            },
-            params={"offset": current_offset},
-        )
-
-        if not response.json().get("response"):
-            break
-
-        for university in response.json()["response"]:
-            if (
-                not session.query(FacultetusUniversity)
-                .filter(
-                    FacultetusUniversity.university_id == university["university_id"]
-                )
-                .one_or_none()
-            ):
+def iter_university_pages(start: int = 0):
+    """
+    Страницы getUniversities начиная со смещения start в виде (номер страницы, ВУЗы, смещение следующей).
+    """
+    # limit игнорируется, возвращается по 50 универов: шаг paginator узнаёт по ответу
+    for page in Paginator("getUniversities", page_size=50).pages(start):
+        yield page.number, page.records, page.end
+
+
+def sync_universities(resume: bool = False) -> list:
+    """
+    Дополнить facultetus_university новыми ВУЗами. Возвращает идентификаторы всех ВУЗов.
+    При resume=True выгрузка продолжается со страницы, на которой прервался прошлый запуск.
+    """
+    university_ids = KeyIndex.load(session, FacultetusUniversity.university_id)
+    checkpoints = Checkpoints(session, "getUniversities", resume)
+    # следующая страница запрашивается, пока пишется текущая
+    pipeline = Pipeline("university")
+    for page, universities, end in pipeline.run(iter_university_pages(checkpoints.start())):
+        print(f"> Page {page}...")
+        run_metrics.add("rows_transformed", len(universities))
+        for university in universities:
+            if university["university_id"] not in university_ids:
                 session.add(FacultetusUniversity(**university))
+                university_ids.add(university["university_id"])
+        checkpoints.save(None, end)
         session.commit()
+    pipeline.log_summary("university.py")
+    checkpoints.clear()
+    session.commit()
 
-        # limit игнорируется, возвращается по 50 универов
-        current_offset += api_config["OFFSET"] + 30
+    return list(university_ids)
+
+
+@exit_on_fail("university.py")
+def main(resume: bool = False):
+    return sync_universities(resume)
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="ВУЗы из getUniversities.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить со страницы, на которой прервался прошлый запуск",
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     start = time()
-    main()
+    try:
+        with profiled(args.profile, "university"), run_metrics.stage("university"):
+            main(resume=args.resume)
+    finally:
+        run_metrics.finish(session, "university.py")
     end = time()
     time_spent = f"Total time spent: {end - start} sec"
     logger.getLogger("university.py").info(time_spent)
     print(f">> {time_spent} sec")
+    client.log_summary("university.py")
+    pagination_stats.log_summary("university.py")
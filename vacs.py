@@ -1,22 +1,42 @@
 # coding: utf-8
 
 """
-Все релевантные вакансии по выбранному ВУЗу.
+Все релевантные вакансии по выбранному ВУЗу (или по нескольким, см. VAC_UNIVERSITIES).
 """
 
-import copy
-from datetime import datetime, timedelta
-from requests import get
-from sqlalchemy import and_, or_
+from argparse import ArgumentParser
+from datetime import datetime
+from sqlalchemy import func, select, text, update
+from threading import Thread
 from time import time
-from typing import List
+from typing import List, Tuple
 
 from configs.facultetus import api_config
-from misc.helpers import session, transform_list_to_str
+from misc.bulk import fingerprint, sync_links, touch_rows, upsert_rows, write_isolated
+from misc.checkpoint import Checkpoints
+from misc.client import client
+from misc.dead_letter import DeadLetters
+from misc.fanout import FanOut
+from misc.helpers import engine_oracle, session, transform_list_to_str
+from misc.key_index import KeyIndex
 from misc.log import logger
-from misc.tables import FacultetusEmployerSphere, FacultetusSphere, \
-    FacultetusVac, FacultetusVacSphere, \
-    FacultetusVacLog
+from misc.metrics import run_metrics
+from misc.paginator import Paginator, pagination_stats
+from misc.pipeline import Pipeline
+from misc.profiling import add_argument as add_profile_argument, profiled, spans
+from misc.tables import FacultetusEmployerSphere, \
+    FacultetusUniversity, FacultetusVac, FacultetusVacSphere, \
+    FacultetusVacLog, FacultetusVacUniversity
+from spheres import sync_spheres
+
+
+# служебные колонки не участвуют в хеше содержимого вакансии
+VAC_HASH_COLUMNS = [
+    column for column in FacultetusVac.__table__.columns.keys()
+    if column not in ("date_added", "date_updated", "date_deleted", "content_hash", "sync_run_id")
+]
+# колонки вакансии, из которых строится mv_facultetus_employer
+EMPLOYER_COLUMNS = ("employer_id", "employer_title", "employer_slogan", "employer_logo", "employer_type")
 
 
 def split_list(big_list: list, number_splits: int) -> List[List]:
@@ -26,194 +46,356 @@ def split_list(big_list: list, number_splits: int) -> List[List]:
     return [big_list[i:i+number_splits] for i in range(0, len(big_list), number_splits)]
 
 
-def main():
+def normalize_vac(vac: dict) -> dict:
     """
-    Главная функция.
+    Привести вакансию из getPositions к виду строки facultetus_vac.
+    """
+    for field in ("spheres", "langs", "skills", "tests", "professions"):
+        vac[field] = transform_list_to_str(vac[field]) if vac.get(field) else None
+
+    for field in ("cash_from", "cash_to"):
+        vac[field] = int(vac[field]) if vac[field] else None
+
+    for field in ("description", "requirements", "cond"):
+        if isinstance(vac[field], str):
+            vac[field] = vac[field][:3997] + '...' if len(vac[field]) > 4000 else vac[field]
+
+    vac["content_hash"] = fingerprint(vac, VAC_HASH_COLUMNS)
+    return vac
+
+
+def fetch_university_positions(university_id, fan_out: FanOut, start_offset: int = 0) -> int:
+    """
+    Выгрузить страницы getPositions одного ВУЗа начиная со смещения start_offset
+    в fan_out. Возвращает число страниц.
+
+    При api_config["CONCURRENCY"] > 1 страницы запрашиваются асинхронно
+    с упреждением, иначе — последовательно.
     """
-    print("Update spheres...")
-    response = get(
-        url=f"https://facultetus.ru/api/{api_config['CLIENT_SECRET']}/getlib",
-        headers={
-            "Content-Type": "application/json; charset=UTF-8",
-        },
-        params={"lib": "spheres"}
+    paginator = Paginator(
+        "getPositions", {"university_id": university_id}, concurrency=api_config.get("CONCURRENCY", 1)
     )
+    count = 0
+    for page in paginator.pages(start_offset):
+        if not fan_out.put((university_id, page.offset, page.records, page.end)):
+            break
+        count += 1
+    return count
+
+
+def iter_university_pages(university_ids: list, checkpoints: Checkpoints):
+    """
+    Страницы getPositions всех ВУЗов university_ids в виде (ВУЗ, смещение, вакансии, смещение следующей);
+    каждый ВУЗ начинается с отметки checkpoints.
+
+    ВУЗы выгружаются параллельно в api_config["WORKERS"] потоков (misc/fanout.py),
+    страницы отдаются по мере готовности, вперемешку между ВУЗами. Ошибки выгрузки
+    поднимаются после последней страницы, до отметки удалённых вакансий.
+    """
+    def fetch(university_id, fan_out: FanOut) -> int:
+        return fetch_university_positions(university_id, fan_out, checkpoints.start(university_id))
+
+    yield from FanOut(api_config.get("WORKERS", 1)).run(fetch, university_ids)
+
+
+def page_normalizer(vac_universities: KeyIndex):
+    """
+    Функция, превращающая страницу из iter_university_pages в (ВУЗ, смещение, строки facultetus_vac,
+    отбракованные вакансии с ошибками, смещение следующей страницы).
+
+    Вакансия, пришедшая от нескольких ВУЗов, нормализуется и отдаётся один раз,
+    а все пары (ВУЗ, вакансия) копятся в vac_universities.
+    """
+    seen = KeyIndex(FacultetusVac.position_id)
+
+    def normalize(page: tuple) -> tuple:
+        university_id, current_offset, records, end = page
+        vacs, rejected = [], []
+        for vac in records:
+            vac_universities.add((university_id, vac["position_id"]))
+            if vac["position_id"] in seen:
+                continue
+            seen.add(vac["position_id"])
+            try:
+                vacs.append(normalize_vac(vac))
+            except Exception as e:
+                rejected.append((vac, e))
+        run_metrics.add("rows_transformed", len(vacs) + len(rejected))
+        return university_id, current_offset, vacs, rejected, end
+
+    return normalize
+
+
+def vac_university_ids(known_ids: list = None) -> Tuple[list, bool]:
+    """
+    ВУЗы, по которым выгружаются вакансии, и признак, что это все известные ВУЗы.
+
+    api_config["VAC_UNIVERSITIES"] — список идентификаторов или "all" (все ВУЗы
+    из facultetus_university или known_ids, если они уже выгружены);
+    по умолчанию — только api_config["UNIVERSITY_ID"]. Идентификаторы приводятся к числам:
+    из переменных окружения они приходят строками.
+    """
+    setting = api_config.get("VAC_UNIVERSITIES")
+    if setting == "all":
+        if known_ids is None:
+            known_ids = list(session.execute(select(FacultetusUniversity.university_id)).scalars())
+        return [int(university_id) for university_id in known_ids], True
+    return [int(university_id) for university_id in setting or [api_config["UNIVERSITY_ID"]]], False
 
-    if not response.json().get("spheres"):
+
+def employer_key(values) -> tuple:
+    # значения из API и из БД могут различаться типом (строка/число)
+    return tuple(None if value is None else str(value) for value in values)
+
+
+def refresh_employers(run_id: int):
+    """
+    Обновить mv_facultetus_employer в отдельном соединении и записать длительность в лог запуска.
+
+    Метод обновления — api_config["MV_REFRESH_METHOD"]: "?" (по умолчанию) — быстрое
+    обновление по журналам, если оно возможно, иначе полное; "F" — только быстрое; "C" — полное.
+    """
+    start = time()
+    try:
+        with spans.span("mv_facultetus_employer refresh"), engine_oracle.begin() as connection:
+            connection.execute(
+                text("BEGIN DBMS_SNAPSHOT.REFRESH('apiuser.mv_facultetus_employer', :method); END;"),
+                {"method": api_config.get("MV_REFRESH_METHOD", "?")}
+            )
+        seconds = time() - start
+        with engine_oracle.begin() as connection:
+            connection.execute(
+                update(FacultetusVacLog).where(FacultetusVacLog.id == run_id).values(mv_refresh_time=seconds)
+            )
+    except Exception as e:
+        logger.getLogger("vacs.py").error("Employers refresh failed", exc_info=True)
+        print(f">>> Employers refresh failed: {repr(e)}")
         return
 
-    for sp in response.json()['spheres']:
-        if (
-            not session.query(FacultetusSphere)
-            .filter(FacultetusSphere.name == sp)
-            .one_or_none()
-        ):
-            session.add(FacultetusSphere(name=sp))
+    line = f"Employers refreshed in {seconds:.1f} sec"
+    logger.getLogger("vacs.py").info(line)
+    print(f">> {line}")
+
+
+def start_employers_refresh(run_id: int, employers_changed: bool):
+    """
+    Запустить обновление mv_facultetus_employer в фоне, если данные работодателей менялись.
+    Возвращает поток обновления или None.
+    """
+    if not employers_changed:
+        print("Employers unchanged, skip refresh")
+        return None
+    # материализованное представление работодателей есть только в Oracle
+    if session.bind.dialect.name != "oracle":
+        return None
+
+    print("Update employers in background...")
+    thread = Thread(target=refresh_employers, args=(run_id,), name="employers-refresh")
+    thread.start()
+    return thread
+
+
+def main(spheres_dict: dict = None, university_ids: list = None, resume: bool = False):
+    """
+    Главная функция.
+
+    spheres_dict — уже выгруженные сферы (название -> id); если не передан,
+    сферы обновляются здесь же. university_ids — уже выгруженные ВУЗы для режима
+    VAC_UNIVERSITIES = "all". resume — продолжить прерванный запуск с записанных страниц.
+    Возвращает поток фонового обновления mv_facultetus_employer (или None),
+    чтобы вызывающий мог дождаться его завершения.
+    """
+    # запись лога создаётся сразу: её id — идентификатор запуска, которым отмечаются
+    # пришедшие вакансии; при сбое она так и остаётся с successfully=0
+    checkpoints = Checkpoints(session, "getPositions", resume)
+    run = session.get(FacultetusVacLog, checkpoints.run_id) if checkpoints.run_id else None
+    # продолжение идёт под id прерванного запуска: вакансии, записанные до сбоя,
+    # уже отмечены им и не попадут в удалённые
+    resumed = run is not None and not run.successfully
+    if resumed:
+        print(f"Resume run {run.id} from {len(checkpoints.offsets)} checkpoints...")
+    else:
+        checkpoints.clear()
+        run = FacultetusVacLog(successfully=0, added=0, updated=0, unchanged=0, deleted=0)
+        session.add(run)
     session.commit()
+    run_metrics.current().vac_log_id = run.id
 
-    spheres_list = [sphere.__dict__ for sphere in session.query(FacultetusSphere).all()]
-    spheres_dict = {sphere['name']: sphere['id'] for sphere in spheres_list}
-    current_offset = 0
-    vacs_added, vacs_updated, vacs_droped = 0, 0, 0
-    vacs_affected = []
-    date_updated = datetime.now()
-    print("Update vacs...")
-    while True:
-        print(f"> Page {int(current_offset / api_config['OFFSET'])}...")
-        response = get(
-            url=f"https://facultetus.ru/api/{api_config['CLIENT_ID']}/getPositions",
-            headers={
-                "Content-Type": "application/json; charset=UTF-8",
-            },
-            params={
-                "university_id": api_config["UNIVERSITY_ID"],
-                "offset": current_offset
-            },
-        )
+    if spheres_dict is None:
+        print("Update spheres...")
+        spheres_dict = sync_spheres()
 
-        if response.json()["response"] == []:
-            break
+    if not spheres_dict:
+        return
 
-        for vac in response.json()["response"]:
-            for field in ("spheres", "langs", "skills", "tests", "professions"):
-                vac[field] = transform_list_to_str(vac[field]) if vac.get(field) else None
-
-            for field in ("cash_from", "cash_to"):
-                vac[field] = int(vac[field]) if vac[field] else None
-
-            for field in ("description", "requirements", "cond"):
-                if isinstance(vac[field], str):
-                    vac[field] = vac[field][:3997] + '...' if len(vac[field]) > 4000 else vac[field]
-
-            if (
-                not session.query(FacultetusVac)
-                .filter(FacultetusVac.position_id == vac["position_id"])
-                .one_or_none()
-            ):
-                vacs_added += 1
-                vacs_affected.append(vac["position_id"])
-                session.add(FacultetusVac(**vac))
+    # хеши содержимого: неизменившиеся вакансии только отмечаются, а не перезаписываются
+    position_ids = KeyIndex(FacultetusVac.position_id)
+    vac_hashes, vac_employers, deleted_ids = {}, {}, set()
+    for position_id, content_hash, date_deleted, *employer in session.execute(
+        select(
+            FacultetusVac.position_id,
+            FacultetusVac.content_hash,
+            FacultetusVac.date_deleted,
+            *[FacultetusVac.__table__.c[column] for column in EMPLOYER_COLUMNS]
+        )
+    ):
+        key = position_ids.key(position_id)
+        vac_hashes[key] = content_hash
+        vac_employers[key] = employer_key(employer)
+        if date_deleted:
+            deleted_ids.add(key)
+    position_ids.update(vac_hashes)
+    # mv_facultetus_employer обновляется, только если изменились данные работодателей;
+    # что изменилось до сбоя, при продолжении неизвестно
+    employers_changed = resumed
+    # связи со сферами копятся за весь запуск и сверяются с БД в конце
+    employer_spheres = KeyIndex(FacultetusEmployerSphere.employer_id, FacultetusEmployerSphere.sphere_id)
+    vac_spheres = KeyIndex(FacultetusVacSphere.position_id, FacultetusVacSphere.sphere_id)
+    vac_universities = KeyIndex(FacultetusVacUniversity.university_id, FacultetusVacUniversity.position_id)
+    university_ids, all_universities = vac_university_ids(university_ids)
+    vacs_droped = 0
+    run_id = run.id
+    dead_letters = DeadLetters(session, "getPositions", "position_id", run_id)
+    # пришедшая вакансия актуальна, даже если раньше была отмечена удалённой
+    refreshed = {"date_updated": datetime.now(), "date_deleted": None}
+    print("Update vacs...")
+    # пока пачка пишется в БД, следующие уже запрашиваются и нормализуются
+    pipeline = Pipeline("vacs")
+    pages = pipeline.run(iter_university_pages(university_ids, checkpoints), page_normalizer(vac_universities))
+    for university_id, current_offset, vacs, rejected, end in pages:
+        print(f"> University ID: {university_id}, page {int(current_offset / api_config['OFFSET'])}...")
+        changed, unchanged = [], []
+        for vac in vacs:
+            key = position_ids.key(vac["position_id"])
+            employer = employer_key(vac.get(column) for column in EMPLOYER_COLUMNS)
+            if key in deleted_ids or vac_employers.get(key) != employer:
+                employers_changed = True
+                vac_employers[key] = employer
+                deleted_ids.discard(key)
+            if vac_hashes.get(key) == vac["content_hash"]:
+                unchanged.append(vac["position_id"])
             else:
-                vac_copy = copy.deepcopy(vac)
-                del vac_copy["position_id"]
-                vac_copy["date_updated"] = date_updated
-                session.query(FacultetusVac) \
-                    .filter(FacultetusVac.position_id == vac["position_id"]) \
-                    .update(vac_copy)
-                vacs_updated += 1
-                vacs_affected.append(vac["position_id"])
-            session.commit()
+                vac["sync_run_id"] = run_id
+                changed.append(vac)
+                vac_hashes[key] = vac["content_hash"]
 
+        rejected = [(vac, error, "normalize") for vac, error in rejected]
+        # вакансия, которую БД не принимает, уходит в facultetus_dead_letter, остальные пишутся
+        written = write_isolated(
+            session,
+            lambda rows: upsert_rows(
+                session, FacultetusVac, rows, "position_id", extra=refreshed, index=position_ids
+            ),
+            changed,
+            lambda vac, error: rejected.append((vac, error, "write"))
+        )
+        page_unchanged = touch_rows(
+            session, FacultetusVac, "position_id", unchanged, {**refreshed, "sync_run_id": run_id}
+        )
+        for vac, error, stage in rejected:
+            dead_letters.add(vac, error, stage)
+        # отбракованная вакансия есть в API: уже загруженная строка не должна попасть в удалённые
+        touch_rows(
+            session, FacultetusVac, "position_id",
+            [vac["position_id"] for vac, _, _ in rejected if vac.get("position_id") in position_ids],
+            {"sync_run_id": run_id}
+        )
+        # счётчики копятся в строке лога в одной транзакции с отметкой страницы:
+        # после --resume в них остаются и страницы, записанные до сбоя
+        session.execute(
+            update(FacultetusVacLog)
+            .where(FacultetusVacLog.id == run_id)
+            .values(
+                added=func.coalesce(FacultetusVacLog.added, 0) + sum(added for added, _ in written),
+                updated=func.coalesce(FacultetusVacLog.updated, 0) + sum(updated for _, updated in written),
+                unchanged=func.coalesce(FacultetusVacLog.unchanged, 0) + page_unchanged
+            ),
+            execution_options={"synchronize_session": False}
+        )
+        checkpoints.save(university_id, end, run_id)
+        session.commit()
+
+        for vac in vacs:
             spheres = vac["spheres"] or ''
             for sphere in spheres.split(";"):
-                sphere_clean = sphere.strip()
-                if sphere_clean:
-                    if (
-                        not session.query(
-                            FacultetusEmployerSphere
-                        ).filter(
-                            and_(
-                                FacultetusEmployerSphere.employer_id == vac["employer_id"],
-                                FacultetusEmployerSphere.sphere_id == spheres_dict.get(sphere_clean, '')
-                            )
-                        ).one_or_none()
-                    ):
-                        session.add(
-                            FacultetusEmployerSphere(
-                                employer_id=vac["employer_id"],
-                                sphere_id=spheres_dict.get(sphere_clean, '')
-                            )
-                        )
-                        session.commit()
-
-                    if (
-                        not session.query(
-                            FacultetusVacSphere
-                        ).filter(
-                            and_(
-                                FacultetusVacSphere.position_id == vac["position_id"],
-                                FacultetusVacSphere.sphere_id == spheres_dict.get(sphere_clean, '')
-                            )
-                        ).one_or_none()
-                    ):
-                        session.add(
-                            FacultetusVacSphere(
-                                position_id=vac["position_id"],
-                                sphere_id=spheres_dict.get(sphere_clean, '')
-                            )
-                        )
-                        session.commit()
-
-        current_offset += api_config["OFFSET"]
-
-    print("Update employers...")
-    session.execute("""
-        BEGIN
-            DBMS_SNAPSHOT.REFRESH('apiuser.mv_facultetus_employer');
-        END;
-    """)
-
-    vac_hours_delta = 2
-    print("Mark actual and outdated vacancies...")
-    session.query(
-        FacultetusVac
-        ).filter(
-            and_(
-                FacultetusVac.date_added.isnot(None),
-                FacultetusVac.date_updated > datetime.now() - timedelta(hours=vac_hours_delta)
-            )
-        ).update({
-            "date_deleted": None
-        })
-    session.commit()
+                sphere_id = spheres_dict.get(sphere.strip())
+                if sphere_id:
+                    employer_spheres.add((vac["employer_id"], sphere_id))
+                    vac_spheres.add((vac["position_id"], sphere_id))
 
-    vacs_droped = session.query(
-        FacultetusVac
-        ).filter(
-            or_(
-                and_(
-                    FacultetusVac.date_added <= datetime.now() - timedelta(hours=vac_hours_delta),
-                    FacultetusVac.date_updated.is_(None)
-                ),
-                and_(
-                    FacultetusVac.date_added.isnot(None),
-                    FacultetusVac.date_updated <= datetime.now() - timedelta(hours=vac_hours_delta)
-                )
-            )
-        ).update({
-            "date_deleted": datetime.now()
-        })
+    pipeline.log_summary("vacs.py")
+    dead_letters.log_summary("vacs.py")
+
+    print("Update sphere links...")
+    # связи страниц, записанных до сбоя, не накоплены: при продолжении лишние
+    # связи не удаляются, их уберёт следующий полный запуск
+    for links in (employer_spheres, vac_spheres):
+        inserted, deleted = sync_links(session, links, prune=not resumed)
+        print(f"> {links.columns[0].table.name}: {inserted} inserted, {deleted} deleted")
+        if links is employer_spheres and inserted + deleted:
+            employers_changed = True
+    # связи сверяются только по выгруженным ВУЗам, если выгружались не все
+    inserted, deleted = sync_links(
+        session,
+        vac_universities,
+        where=None if all_universities else FacultetusVacUniversity.university_id.in_(university_ids),
+        prune=not resumed
+    )
+    print(f"> facultetus_vac_university: {inserted} inserted, {deleted} deleted")
     session.commit()
 
+    # пустая выгрузка считается сбоем API, а не снятием всех вакансий. Проверяется
+    # по БД, а не по счётчикам процесса: при --resume после сбоя на последней
+    # странице все вакансии запуска отмечены ещё до него
+    stamped = session.execute(
+        select(FacultetusVac.position_id).where(FacultetusVac.sync_run_id == run_id).limit(1)
+    ).first()
+    if stamped:
+        print("Mark outdated vacancies...")
+        # id запусков растут, а продолжать можно только последний запуск, поэтому
+        # «не отмечена этим запуском» — это sync_run_id < run_id: диапазон по
+        # ix_facultetus_vac_live_run (date_deleted, sync_run_id) только среди живых вакансий
+        vacs_droped = session.execute(
+            update(FacultetusVac)
+            .where(FacultetusVac.date_deleted.is_(None), FacultetusVac.sync_run_id < run_id)
+            .values(date_deleted=datetime.now())
+        ).rowcount
+        if vacs_droped:
+            employers_changed = True
+
+    # отметка удалённых фиксируется вместе с завершением запуска: продолжение
+    # не застанет удалённые без их числа в логе
     print("Log upload completion...\n")
-    session.add(
-        FacultetusVacLog(
-            added=vacs_added,
-            updated=vacs_updated,
-            deleted=vacs_droped,
-            successfully=1
-        )
-    )
+    run.deleted = vacs_droped
+    run.successfully = 1
+    checkpoints.clear()
     session.commit()
 
+    # представление обновляется после отметки удалённых, чтобы учесть и их
+    return start_employers_refresh(run_id, employers_changed)
+
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Вакансии ВУЗов из getPositions.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить прерванный запуск со страниц, на которых он остановился",
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     start = time()
     try:
-        main()
+        with profiled(args.profile, "vacs"), run_metrics.stage("vacs"):
+            refresh = main(resume=args.resume)
+            if refresh:
+                refresh.join()
     except Exception as e:
         session.rollback()
         error_text = "Exception occurred"
         print(">>>" + error_text)
 
-        print("Log upload completion...")
-        session.add(
-            FacultetusVacLog(
-                successfully=0
-            )
-        )
-        session.commit()
-
         logger.getLogger("vacs.py").error(error_text, exc_info=True)
         print(f">>> {error_text}: {repr(e)}")
 
@@ -221,3 +403,6 @@ if __name__ == "__main__":
     time_spent = f"Total time spent: {end - start} sec"
     logger.getLogger("vacs.py").info(time_spent)
     print(f">> {time_spent}")
+    client.log_summary("vacs.py")
+    pagination_stats.log_summary("vacs.py")
+    run_metrics.finish(session, "vacs.py")
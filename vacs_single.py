@@ -4,13 +4,14 @@
 """
 import os
 import sys
-import copy
 import logging
 from datetime import datetime, timedelta
 from time import time
 from requests import get
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, ForeignKey, Integer, TIMESTAMP, VARCHAR, text, DateTime, and_, or_
+from sqlalchemy import create_engine, Column, ForeignKey, Integer, TIMESTAMP, VARCHAR, text, DateTime, and_, or_, \
+    bindparam, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -22,6 +23,7 @@ UNIVERSITY_ID = os.getenv("UNIVERSITY_ID")
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 OFFSET = int(os.getenv("FACULTETUS_OFFSET", "20"))
+CHUNK_SIZE = int(os.getenv("FACULTETUS_CHUNK_SIZE", "500"))
 
 DB_URL = "{DB_TYPE}+{DB_DRIVER}://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}".format(
     DB_TYPE=os.getenv("DB_TYPE"),
@@ -155,6 +157,59 @@ except Exception as e:
 def transform_list_to_str(elems: list, delimeter: str = ";") -> str:
     return delimeter.join([elem["data"] for elem in elems])
 
+def upsert_vacs(rows: list, date_updated: datetime):
+    """
+    Bulk upsert of vacancies: MERGE for Oracle, INSERT ... ON CONFLICT for PostgreSQL/SQLite.
+    Returns (added, updated).
+    """
+    table = FacultetusVac.__table__
+    dialect_name = session.bind.dialect.name
+    rows = list({row["position_id"]: row for row in rows}.values())
+    added, updated = 0, 0
+
+    for i in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[i:i + CHUNK_SIZE]
+        columns = [c for c in table.columns.keys() if any(c in row for row in chunk)]
+        chunk = [{c: row.get(c) for c in columns} for row in chunk]
+        existing = set(session.execute(
+            select(table.c.position_id).where(table.c.position_id.in_([row["position_id"] for row in chunk]))
+        ).scalars())
+        added += sum(1 for row in chunk if row["position_id"] not in existing)
+        updated += sum(1 for row in chunk if row["position_id"] in existing)
+        params = [{**{f"b_{c}": v for c, v in row.items()}, "e_date_updated": date_updated} for row in chunk]
+
+        if dialect_name == "oracle":
+            quote = session.bind.dialect.identifier_preparer.quote
+            session.execute(text(
+                f"MERGE INTO apiuser.facultetus_vac t "
+                f"USING (SELECT {', '.join(f':b_{c} AS {quote(c)}' for c in columns)} FROM dual) s "
+                f"ON (t.position_id = s.position_id) "
+                f"WHEN MATCHED THEN UPDATE SET "
+                f"{', '.join(f't.{quote(c)} = s.{quote(c)}' for c in columns if c != 'position_id')}, "
+                f"t.date_updated = :e_date_updated "
+                f"WHEN NOT MATCHED THEN INSERT ({', '.join(quote(c) for c in columns)}) "
+                f"VALUES ({', '.join(f's.{quote(c)}' for c in columns)})"
+            ), params)
+        elif dialect_name in ("postgresql", "sqlite"):
+            stmt = (postgresql if dialect_name == "postgresql" else sqlite).insert(table)
+            set_ = {c: stmt.excluded[c] for c in columns if c != "position_id"}
+            set_["date_updated"] = date_updated
+            session.execute(stmt.on_conflict_do_update(index_elements=["position_id"], set_=set_), chunk)
+        else:
+            new_rows = [row for row in chunk if row["position_id"] not in existing]
+            old_params = [p for p in params if p["b_position_id"] in existing]
+            if new_rows:
+                session.execute(insert(table), new_rows)
+            if old_params:
+                values = {c: bindparam(f"b_{c}") for c in columns if c != "position_id"}
+                values["date_updated"] = bindparam("e_date_updated")
+                session.execute(
+                    update(table).where(table.c.position_id == bindparam("b_position_id")).values(values),
+                    old_params
+                )
+
+    return added, updated
+
 # --- Main Logic ---
 def main():
     logger.info("Update spheres...")
@@ -196,6 +251,8 @@ def main():
         if not resp_json.get("response"):
             break
 
+        vacs = []
+        allowed_keys = FacultetusVac.__table__.columns.keys()
         for vac in resp_json["response"]:
             for field in ("spheres", "langs", "skills", "tests", "professions"):
                 vac[field] = transform_list_to_str(vac[field]) if vac.get(field) else None
@@ -208,20 +265,14 @@ def main():
                     if len(vac[field]) > 4000:
                         vac[field] = vac[field][:3997] + '...'
 
-            allowed_keys = FacultetusVac.__table__.columns.keys()
-            vac_data = {k: v for k, v in vac.items() if k in allowed_keys}
+            vacs.append({k: v for k, v in vac.items() if k in allowed_keys})
 
-            if not session.query(FacultetusVac).filter(FacultetusVac.position_id == vac["position_id"]).one_or_none():
-                vacs_added += 1
-                session.add(FacultetusVac(**vac_data))
-            else:
-                vac_copy = copy.deepcopy(vac_data)
-                del vac_copy["position_id"]
-                vac_copy["date_updated"] = date_updated
-                session.query(FacultetusVac).filter(FacultetusVac.position_id == vac["position_id"]).update(vac_copy)
-                vacs_updated += 1
-            session.commit()
+        added, updated = upsert_vacs(vacs, date_updated)
+        vacs_added += added
+        vacs_updated += updated
+        session.commit()
 
+        for vac in vacs:
             spheres = vac.get("spheres") or ''
             for sphere in spheres.split(";"):
                 sphere_clean = sphere.strip()